@@ -0,0 +1,116 @@
+"""
+CPU time per page of the targeted page_contents parse against the original full-tree parse.
+
+The original path sniffs the charset over the whole body when the server declares none and builds a complete
+html.parser tree before finding one tag. The targeted path takes CONFIG.SITE_ENCODING, parses with
+CONFIG.HTML_PARSER and keeps only the requested tag through a SoupStrainer.
+
+Pages come from the scraper's page cache, so run a crawl with PAGE_CACHE_ENABLED first.
+Run from the project root:  python -m benchmarks.bench_html_parsing
+"""
+import json
+import argparse
+from pathlib import Path
+from time import process_time
+
+from bs4 import BeautifulSoup
+from requests.compat import chardet
+
+from util.path_resolver import PATH_RESOLVER as REPATH
+from data_scraping.scraping_util import page_contents
+
+
+def reference_page_contents(content, content_type, tag=None, tag_class=None, tag_id=None):
+    """page_contents before the targeted parse, kept as the reference implementation"""
+    encoding = None
+    if content_type and len(content_type.split('charset=')) > 1:
+        encoding = content_type.split('charset=')[1].strip()
+    if encoding is None:
+        encoding = chardet.detect(content)['encoding'] or 'utf-8'
+    soup = BeautifulSoup(content.decode(encoding, errors='replace'), 'html.parser')
+
+    if tag is None:
+        return soup
+    attrs = {}
+    if tag_class:
+        attrs['class'] = tag_class
+    if tag_id:
+        attrs['id'] = tag_id
+    return soup.find(tag, attrs=attrs, recursive=True)
+
+
+def _lookups(url):
+    """(tag, class, id) the scraper requests from a page, by the kind of page its URL points to"""
+    if url == REPATH.CATEGORY_PAGE:
+        return [('ul', None, 'categories')]
+    if url.startswith(REPATH.CATEGORY_PAGE):
+        return [('div', 'search-results', None)]
+    if url == REPATH.ALPHABET_PAGE:
+        return [('ul', 'alphabet-letter-list', None)]
+    if url.startswith(REPATH.ALPHABET_PAGE):
+        return [('div', 'alphabet-letter-video', None)]
+    # word pages and their nav tabs
+    return [('div', 'search-result-content', None), ('video', None, None)]
+
+
+def _cached_pages(cache_dir, declared_charset):
+    for entry_path in sorted(Path(cache_dir).glob('*/*.json')):
+        body_path = entry_path.with_suffix('.body')
+        if not body_path.exists():
+            continue
+        with open(entry_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        content_type = entry.get('content_type') if declared_charset else 'text/html'
+        yield entry['url'], body_path.read_bytes(), content_type
+
+
+def _signature(tag):
+    if tag is None:
+        return None
+    return tag.name, sorted((key, str(value)) for key, value in tag.attrs.items()), tag.get_text(' ', strip=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cache-dir', type=Path, default=REPATH.PAGE_CACHE_DIR)
+    parser.add_argument('--limit', type=int, default=500, help='pages to parse at most')
+    parser.add_argument('--declared-charset', action='store_true',
+                        help='keep the cached Content-Type, by default pages are parsed as if no charset was declared')
+    args = parser.parse_args()
+
+    pages = []
+    for page in _cached_pages(args.cache_dir, args.declared_charset):
+        pages.append(page)
+        if len(pages) >= args.limit:
+            break
+    if not pages:
+        print(f'No cached pages in {args.cache_dir}, run the scraper with PAGE_CACHE_ENABLED first')
+        return
+
+    reference_time = targeted_time = 0.0
+    lookups = mismatches = 0
+    for url, content, content_type in pages:
+        for tag, tag_class, tag_id in _lookups(url):
+            start = process_time()
+            expected = reference_page_contents(content, content_type, tag, tag_class, tag_id)
+            reference_time += process_time() - start
+
+            start = process_time()
+            actual = page_contents(content, content_type, url, tag, tag_class, tag_id)
+            targeted_time += process_time() - start
+
+            lookups += 1
+            if _signature(expected) != _signature(actual):
+                mismatches += 1
+                print(f'Different result for <{tag}> class "{tag_class}" id "{tag_id}" at {url}')
+
+    size = sum(len(content) for _, content, _ in pages) / len(pages)
+    print(f'{len(pages)} pages, {lookups} lookups, {size / 1024:.1f} KiB per page, {mismatches} different results')
+    print(f'full parse:     {reference_time / lookups * 1000:8.2f} ms CPU per lookup')
+    print(f'targeted parse: {targeted_time / lookups * 1000:8.2f} ms CPU per lookup')
+    print(f'saved:          {(reference_time - targeted_time) / lookups * 1000:8.2f} ms CPU per lookup, '
+          f'{reference_time / targeted_time:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compares the NumPy pose_parser against the original pandas implementation on synthetic annotations.
+
+Run from the project root:  python -m benchmarks.bench_pose_parser
+"""
+import argparse
+import numpy as np
+from time import perf_counter
+from warnings import catch_warnings, simplefilter
+
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_pose_frame
+from pose_estimation.pose_postprocessing import parse_pose_frame, valid_cols, hand_cols, non_hand_cols
+
+
+def pandas_pose_parser(raw_df):
+    """The pose_parser body before vectorization, kept as the reference implementation"""
+    raw_df = raw_df.copy()
+    with catch_warnings():
+        simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
+        for col in valid_cols:
+            if col not in raw_df.columns:
+                raw_df[col] = -1
+
+    valid_df = raw_df[valid_cols].copy()
+
+    if valid_df[non_hand_cols].isna().any().any():
+        valid_df.loc[:, non_hand_cols] = valid_df[non_hand_cols].interpolate(method='linear', limit_direction='both', axis=0)
+    if valid_df[hand_cols].isna().any().any():
+        valid_df.loc[:, hand_cols] = valid_df[hand_cols].fillna(-1)
+
+    valid_df = valid_df[~valid_df[hand_cols].eq(-1).all(axis=1)]
+    if len(valid_df) >= 20:
+        valid_df = valid_df[2:-2]
+
+    return valid_df.astype(float).values.tolist()
+
+
+def _clips(count, seed):
+    rng = np.random.default_rng(seed)
+    clips = []
+    for i in range(count):
+        # round trip through float64 like a CSV read does
+        df = synthetic_pose_frame(int(rng.integers(10, 120)), seed=seed + i,
+                                  hand_rate=float(rng.uniform(0.3, 1.0))).astype(np.float64)
+        if i % 3 == 0:
+            # drop a whole group, as when a hand is never detected in a clip
+            df = df.drop(columns=[col for col in df.columns if col.startswith('left_hand_world_landmarks')])
+        clips.append(df)
+    return clips
+
+
+def _time(parser, clips, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        for clip in clips:
+            parser(clip)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clips', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    clips = _clips(args.clips, args.seed)
+    for clip in clips:
+        expected = pandas_pose_parser(clip)
+        actual = parse_pose_frame(clip)
+        if not np.array_equal(np.array(expected), np.array(actual), equal_nan=True):
+            raise AssertionError('NumPy pose parser output differs from the pandas reference')
+
+    pandas_time = _time(pandas_pose_parser, clips, args.repeat)
+    numpy_time = _time(parse_pose_frame, clips, args.repeat)
+    frames = sum(len(clip) for clip in clips)
+    print(f'{len(clips)} clips, {frames} frames, outputs identical')
+    print(f'pandas parser: {pandas_time:8.3f}s  {frames / pandas_time:10.0f} frames/s')
+    print(f'numpy parser:  {numpy_time:8.3f}s  {frames / numpy_time:10.0f} frames/s')
+    print(f'speedup:       {pandas_time / numpy_time:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Storage size and reconstruction error of each POSE_STORAGE_PRECISION against full precision output.
+
+Every synthetic clip is written with each precision and file type, read back through PoseScribe and compared
+with the float32 frame it was written from, per annotation group and after pose_parser.
+
+Run from the project root:  python -m benchmarks.bench_pose_precision
+"""
+import argparse
+import tempfile
+import numpy as np
+from pathlib import Path
+
+from benchmarks.synthetic import synthetic_pose_frame
+from config.config import CONFIG
+from pose_estimation.pose_scribe import PoseScribe
+from pose_estimation.pose_quantization import PRECISIONS, column_group
+from pose_estimation.pose_postprocessing import parse_pose_frame
+
+
+FILE_TYPES = ('.pose.bin', '.parquet')
+
+
+def _errors(reference, restored, columns):
+    """{group: (max abs error, rms error)} over values present in the reference"""
+    errors = {}
+    for group in dict.fromkeys(column_group(column) for column in columns):
+        indices = [i for i, column in enumerate(columns) if column_group(column) == group]
+        ref, res = reference[:, indices], restored[:, indices]
+        present = ~np.isnan(ref)
+        if np.isnan(res[present]).any() or (~np.isnan(res[~present])).any():
+            raise AssertionError(f'Missing values of {group} were not preserved')
+        diff = np.abs(ref[present].astype(np.float64) - res[present])
+        errors[group] = (diff.max(initial=0.0), np.sqrt(np.mean(diff ** 2)) if diff.size else 0.0)
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clips', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    clips = [synthetic_pose_frame(int(rng.integers(10, 120)), seed=args.seed + i) for i in range(args.clips)]
+    frames = sum(len(clip) for clip in clips)
+    print(f'{len(clips)} clips, {frames} frames')
+
+    default_precision = CONFIG.POSE_STORAGE_PRECISION
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for file_type in FILE_TYPES:
+                for precision in PRECISIONS:
+                    CONFIG.POSE_STORAGE_PRECISION = precision
+                    size = 0
+                    group_errors = {}
+                    parsed_error = 0.0
+                    for i, clip in enumerate(clips):
+                        path = Path(tmp) / f'{i}_{precision}{file_type}'
+                        PoseScribe.writers[file_type](clip, path)
+                        size += path.stat().st_size
+                        restored = PoseScribe.readers[file_type](path)
+
+                        columns = list(clip.columns)
+                        for group, (max_error, rms) in _errors(clip.to_numpy(np.float32),
+                                                               restored[columns].to_numpy(np.float64),
+                                                               columns).items():
+                            worst, total = group_errors.get(group, (0.0, 0.0))
+                            group_errors[group] = (max(worst, max_error), total + rms ** 2 * len(clip))
+
+                        reference = parse_pose_frame(clip, as_array=True)
+                        parsed = parse_pose_frame(restored, as_array=True)
+                        if reference.shape != parsed.shape:
+                            raise AssertionError(f'{precision} changed which frames pose_parser keeps')
+                        parsed_error = max(parsed_error, np.abs(reference - parsed).max(initial=0.0))
+
+                    print(f'\n{file_type} {precision}: {size / frames:9.1f} bytes/frame, '
+                          f'pose_parser max abs error {parsed_error:.3g}')
+                    for group, (worst, total) in group_errors.items():
+                        print(f'    {group:<28} max {worst:10.3g}   rms {np.sqrt(total / frames):10.3g}')
+    finally:
+        CONFIG.POSE_STORAGE_PRECISION = default_precision
+
+
+if __name__ == '__main__':
+    main()
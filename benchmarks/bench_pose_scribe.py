@@ -0,0 +1,140 @@
+"""
+Write, read and pose_parser throughput, bytes per frame and peak memory of every PoseScribe file type.
+
+Synthetic holistic results shaped like MediaPipe output are flattened the way estimate_poses does it and written
+with each writer. Every file is then read back with its reader and parsed with pose_parser. Runs offline on CPU.
+Peak memory is the tracemalloc peak of each phase, which covers Python and NumPy allocations.
+
+Run from the project root:  python -m benchmarks.bench_pose_scribe
+Save a baseline with --output and compare later runs against it with --baseline.
+"""
+import sys
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.synthetic import synthetic_holistic_results
+from config.config import CONFIG
+from pose_estimation.pose_buffer import PoseBuffer
+from pose_estimation.pose_schema import LANDMARK_COUNTS
+from pose_estimation.pose_scribe import PoseScribe
+from pose_estimation.pose_postprocessing import pose_parser
+
+
+def _clips(count, groups, seed):
+    rng = np.random.default_rng(seed)
+    clips = []
+    for i in range(count):
+        results = synthetic_holistic_results(int(rng.integers(20, 120)), seed=seed + i,
+                                             hand_rate=float(rng.uniform(0.3, 1.0)))
+        buffer = PoseBuffer(capacity=len(results), groups=groups)
+        for frame, result in enumerate(results):
+            buffer.append(result, frame)
+        clips.append(buffer.to_frame())
+    return clips
+
+
+def _measure(action, items):
+    """(seconds, peak bytes) of calling action on every item"""
+    tracemalloc.reset_peak()
+    start = perf_counter()
+    for item in items:
+        action(*item)
+    seconds = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    return seconds, peak
+
+
+def bench_file_type(file_type, clips, directory, repeat):
+    paths = [directory / f'clip_{i}{file_type}' for i in range(len(clips))]
+    frames = sum(len(clip) for clip in clips)
+    writer = PoseScribe.writers[file_type]
+    reader = PoseScribe.readers[file_type]
+
+    phases = {
+        'write': (writer, list(zip(clips, paths))),
+        'read': (reader, [(path,) for path in paths]),
+        'parse': (pose_parser, [(path,) for path in paths]),
+    }
+    row = {'file_type': file_type}
+    for phase, (action, items) in phases.items():
+        best, peak = float('inf'), 0
+        for _ in range(repeat):
+            seconds, phase_peak = _measure(action, items)
+            best, peak = min(best, seconds), max(peak, phase_peak)
+        row[f'{phase}_frames_per_s'] = frames / best
+        row[f'{phase}_peak_mb'] = peak / 2 ** 20
+
+    row['bytes_per_frame'] = sum(path.stat().st_size for path in paths) / frames
+    return row
+
+
+def _regressions(results, baseline, tolerance):
+    baseline = baseline.set_index('file_type')
+    failures = []
+    for _, row in results.iterrows():
+        if row['file_type'] not in baseline.index:
+            continue
+        old = baseline.loc[row['file_type']]
+        for column in results.columns:
+            if column == 'file_type' or column not in old:
+                continue
+            # throughput should not drop, size and memory should not grow
+            worse = row[column] < old[column] * (1 - tolerance) if column.endswith('_per_s') \
+                else row[column] > old[column] * (1 + tolerance)
+            if worse:
+                failures.append(f'{row["file_type"]} {column}: {old[column]:.1f} -> {row[column]:.1f}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clips', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--file-types', nargs='+', default=list(PoseScribe.writers),
+                        choices=list(PoseScribe.writers))
+    parser.add_argument('--all-groups', action='store_true',
+                        help='store every annotation group instead of CONFIG.SELECTED_POSE_ANNOTATIONS')
+    parser.add_argument('--precision', choices=('float32', 'float16', 'int16'),
+                        default=CONFIG.POSE_STORAGE_PRECISION, help='POSE_STORAGE_PRECISION to write with')
+    parser.add_argument('--output', type=Path, help='save the results as a CSV baseline')
+    parser.add_argument('--baseline', type=Path, help='fail if results are worse than this CSV baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args()
+
+    groups = ['face_blendshapes', *LANDMARK_COUNTS] if args.all_groups else None
+    clips = _clips(args.clips, groups, args.seed)
+    columns = len(clips[0].columns)
+    print(f'{len(clips)} clips, {sum(len(clip) for clip in clips)} frames, {columns} columns, '
+          f'{args.precision} storage precision')
+
+    CONFIG.POSE_STORAGE_PRECISION = args.precision
+    tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            rows = [bench_file_type(file_type, clips, Path(tmp), args.repeat) for file_type in args.file_types]
+    finally:
+        tracemalloc.stop()
+
+    results = pd.DataFrame(rows)
+    with pd.option_context('display.width', 200, 'display.float_format', '{:,.1f}'.format):
+        print(results.to_string(index=False))
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f'Saved results to {args.output}')
+    if args.baseline:
+        failures = _regressions(results, pd.read_csv(args.baseline), args.tolerance)
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Checks that a reused landmarker estimates every video exactly as a fresh landmarker does, i.e. that no tracking
+state leaks from one video into the next. Needs the holistic model and downloaded videos.
+
+Run from the project root:  python -m benchmarks.check_landmarker_reset --videos 10
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from pose_estimation.estimate_poses import holistic_process, _HOLISTIC_OPTIONS
+from pose_estimation.landmarker import ReusableLandmarker
+from pose_estimation.subsampling_report import _sample_videos
+
+
+def _estimate_all(paths, max_reuse, stride):
+    with ReusableLandmarker(_HOLISTIC_OPTIONS, max_reuse=max_reuse) as landmarker:
+        return [holistic_process(path, None, landmarker, stride=stride, max_side=0) for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=10)
+    parser.add_argument('--stride', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--atol', type=float, default=1e-6)
+    args = parser.parse_args()
+
+    paths = _sample_videos(args.videos, args.seed)
+    if len(paths) < 2:
+        sys.exit('Need at least two downloaded videos to compare')
+
+    # max_reuse=1 recreates the landmarker for every video, max_reuse=0 never does
+    fresh = _estimate_all(paths, 1, args.stride)
+    reused = _estimate_all(paths, 0, args.stride)
+
+    mismatches = 0
+    for path, expected, actual in zip(paths, fresh, reused):
+        if expected is None or actual is None:
+            print(f'{path.name:40} skipped, video could not be read')
+            continue
+        for annot_type in expected.groups:
+            a = expected.group_array(annot_type)
+            b = actual.group_array(annot_type)
+            same_detections = a.shape == b.shape and np.array_equal(np.isnan(a), np.isnan(b))
+            error = np.nanmax(np.abs(a - b)) if same_detections and not np.isnan(a).all() else 0.0
+            if not same_detections or error > args.atol:
+                mismatches += 1
+                print(f'{path.name:40} {annot_type:30} differs: '
+                      f'{"detections differ" if not same_detections else f"max abs error {error:.2e}"}')
+
+    print(f'{len(paths)} videos, {mismatches} mismatching landmark groups')
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import numpy as np
+
+from mediapipe.tasks.python.components.containers.category import Category
+from mediapipe.tasks.python.components.containers.landmark import Landmark, NormalizedLandmark
+from mediapipe.tasks.python.vision.holistic_landmarker import HolisticLandmarkerResult
+
+from pose_estimation.pose_schema import LANDMARK_COUNTS, BLENDSHAPE_NAMES
+from pose_estimation.pose_buffer import PoseBuffer
+
+
+def _landmarks(rng, annot_type):
+    count = LANDMARK_COUNTS[annot_type]
+    world = 'world' in annot_type
+    values = rng.normal(0, 0.1, (count, 3)) if world else rng.uniform(0, 1, (count, 3))
+    # like MediaPipe, only the pose landmarks carry visibility and presence
+    scored = annot_type.startswith('pose')
+    scores = rng.uniform(0, 1, (count, 2))
+
+    cls = Landmark if world else NormalizedLandmark
+    return [
+        cls(x=float(x), y=float(y), z=float(z),
+            visibility=float(v) if scored else None, presence=float(p) if scored else None)
+        for (x, y, z), (v, p) in zip(values, scores)
+    ]
+
+
+def synthetic_holistic_results(frames, hand_rate=0.8, face_rate=0.95, seed=0):
+    """
+    HolisticLandmarkerResult objects shaped like MediaPipe output, with hands and face missing in some frames.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for _ in range(frames):
+        hands = {
+            side: rng.uniform() < hand_rate for side in ('left', 'right')
+        }
+        face = rng.uniform() < face_rate
+        results.append(HolisticLandmarkerResult(
+            face_landmarks=_landmarks(rng, 'face_landmarks') if face else [],
+            pose_landmarks=_landmarks(rng, 'pose_landmarks'),
+            pose_world_landmarks=_landmarks(rng, 'pose_world_landmarks'),
+            left_hand_landmarks=_landmarks(rng, 'left_hand_landmarks') if hands['left'] else [],
+            left_hand_world_landmarks=_landmarks(rng, 'left_hand_world_landmarks') if hands['left'] else [],
+            right_hand_landmarks=_landmarks(rng, 'right_hand_landmarks') if hands['right'] else [],
+            right_hand_world_landmarks=_landmarks(rng, 'right_hand_world_landmarks') if hands['right'] else [],
+            face_blendshapes=[
+                Category(index=i, score=float(rng.uniform()), category_name=name)
+                for i, name in enumerate(BLENDSHAPE_NAMES)
+            ] if face else None,
+        ))
+    return results
+
+
+def synthetic_pose_frame(frames, seed=0, **kwargs):
+    """Flat pose annotation frame, as PoseScribe readers return it"""
+    return PoseBuffer.from_results(synthetic_holistic_results(frames, seed=seed, **kwargs)).to_frame()
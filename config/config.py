@@ -13,6 +13,7 @@ class ProjectConfig:
     LOG_FILE_SIZE = 2*1024*1024
     LOG_FILE_COUNT = 10
     REQUESTS_PER_SECOND = 5
+    REQUESTS_SHARED_BY_PROCESSES = True     # all scraper processes on the data directory share REQUESTS_PER_SECOND
 
     SYSTEM_SHUTDOWN_ON_END = False
 
@@ -21,6 +22,8 @@ class ProjectConfig:
     ANNOTATION_CLEANUP_ENABLED = False          # whether to perform annotation cleanup
     SITE_NAME = 'https://spreadthesign.com'     # don't change
     LANG_ALIAS = 'uk.ua'                        # change according to site aliases
+    SITE_ENCODING = 'utf-8'                     # used when a page declares no charset, None to detect it
+    HTML_PARSER = 'lxml'                        # BeautifulSoup parser, 'html.parser' needs no extra package
 
     # don't change these two, unless you know what you're doing
     COOKIES = {'sts_preferences': f'{{"language_choice_message_shown": true, \
@@ -28,9 +31,22 @@ class ProjectConfig:
                                       "show_more_languages": false}}'}
     HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)', 'Referer': 'https://spreadthesign.com/'}
 
-    # resuming from a category also skips dactyl scraping
-    RESUME_FROM_CATEGORY = None         # category name from the category page (e.g. "Numbers", "Language" etc.)
-    RESUME_FROM_CATEGORY_PAGE = None    # integer page number
+    # the crawl frontier remembers every page and video, an interrupted scraping resumes where it stopped
+    FRONTIER_RESET = False              # forget the stored frontier and crawl the site anew
+    FRONTIER_RETRY_FAILED = True        # retry the pages and videos that failed FRONTIER_MAX_ATTEMPTS times before
+    FRONTIER_MAX_ATTEMPTS = 3           # attempts per page or video before it is marked failed
+    FRONTIER_LEASE_SECONDS = 60         # in flight tasks not renewed for this long are assumed abandoned
+    FRONTIER_POLL_SECONDS = 0.5         # wait before looking for new tasks while other workers still scrape pages
+
+    SCRAPING_MAX_IN_FLIGHT = 16         # page requests the asyncio scraper keeps in flight, within REQUESTS_PER_SECOND
+    SCRAPING_PAGE_TASKS = 8             # frontier pages a scraper process works on at once
+    DOWNLOAD_WORKERS = 4                # threads downloading videos, separate from page fetches
+    DOWNLOAD_RETRIES = 3                # attempts per video, each resumes the partial download
+    DOWNLOAD_TIMEOUT = 30               # seconds to connect and between received bytes
+    DOWNLOAD_CHUNK_SIZE = 1 << 16       # bytes written per streamed chunk
+    PAGE_CACHE_ENABLED = True           # keep fetched pages on disk and revalidate them instead of refetching
+    PAGE_CACHE_FRESH_HOURS = 24         # cached pages confirmed within this time are used without any request
+    PAGE_CACHE_TTL_DAYS = 30            # cached pages not confirmed for this long are evicted
 
     # ================================================ POSE  ESTIMATION ================================================
     POSE_ESTIMATION_ENABLED = False         # whether to perform any pose estimation tasks at all
@@ -51,9 +67,17 @@ class ProjectConfig:
         'dactyl': False,
         'words': True
     }
+    POSE_ESTIMATION_WORKERS = 1         # number of worker processes, 1 estimates videos serially in the main process
+    LANDMARKER_MAX_REUSE = 500          # recreate the holistic landmarker after this many videos, 0 or None to never
+    FRAME_PREFETCH_DEPTH = 8            # frames decoded ahead on a background thread, 0 decodes inline
+    POSE_FRAME_STRIDE = 1               # estimate every n-th frame, landmarks of skipped frames are interpolated
+    POSE_MAX_INPUT_SIDE = None          # None or int, frames with a longer side are downscaled before estimation
+    POSE_TIMING_SLOWEST = 10            # number of slowest videos listed after the per-stage timing report in logs/
 
     VIDEO_ANNOTATION_ENABLED = False    # whether to save annotated videos
     FORCE_VIDEO_ANNOTATION = True       # force video annotation, even if the respective annotated video already exists
+    VIDEO_ANNOTATION_OFFLINE = True     # render annotated videos from saved pose annotations after estimation
+    VIDEO_RENDERING_WORKERS = 4         # number of processes rendering annotated videos offline
     VIDEO_ANNOTATION_STYLES = (
         ('pose_landmarks', solutions.pose.POSE_CONNECTIONS, pose_styles.get_pose_landmarks_style()),
         ('face_landmarks', solutions.face_mesh_connections.FACEMESH_CONTOURS, None, pose_styles.get_face_mesh_contours_style()),
@@ -62,9 +86,20 @@ class ProjectConfig:
     )
 
     POSE_ANNOTATION_ENABLED = True      # whether to save pose landmarks
-    FORCE_POSE_ANNOTATION = True        # force pose estimation, even if the respective annotation file already exists
+    FORCE_POSE_ANNOTATION = True        # without the cache, force pose estimation even if the annotation file exists
+    POSE_CACHE_ENABLED = True           # re-estimate only videos whose content, options or model changed, overrides force
+    POSE_CACHE_VERIFY_OUTPUTS = True    # rehash cached annotation files to detect corrupted ones
     REDUCE_POSE_PRECISION = None        # None or int to pass to the round function
+    POSE_STORAGE_PRECISION = 'float32'  # 'float32', 'float16' or 'int16' fixed point, for .pose.bin and .parquet files
+    STREAM_POSE_SERIALIZATION = True    # flatten each frame into a numeric row buffer instead of keeping all results
     MERGE_POSES_TO_ONE_ARCHIVE = True   # compress all pose annotations to one list of pose annotation lists
+    POSE_POSTPROCESSING_WORKERS = 1     # number of processes parsing pose annotations, 1 parses serially
+    POSE_DATASET_FORMAT = 'pickle'      # 'pickle' (full_pose_dataset.pkl) or 'ragged' (memory-mappable float32 frames)
+    POSE_DATASET_INCREMENTAL = True     # reuse ragged dataset clips whose annotation file did not change
+    POSE_DATASET_COMPACT_RATIO = 0.25   # rewrite the ragged dataset once this share of its frames is dead
+    POSE_STORE_ENABLED = True           # also write the sharded pose store, indexed by word and dactyl letter
+    POSE_STORE_SHARDS = 16              # number of pose store shard files
+    POSE_FEATURES_ENABLED = True        # precompute derived pose features next to the ragged dataset
 
     SELECTED_POSE_ANNOTATIONS = {       # only selected annotations will be saved
         'face_blendshapes'              : True,
@@ -81,7 +116,9 @@ class ProjectConfig:
         '.json'     : False,
         '.json.pkl' : False,
         '.csv'      : False,
-        '.csv.pkl'  : True
+        '.csv.pkl'  : True,
+        '.pose.bin' : False,            # binary float32 rows with a column header, memory-mappable
+        '.parquet'  : False,            # columnar float32, readers can load single annotation groups
     }
 
     # ================================================== TRANSLATION ==================================================
@@ -95,6 +132,7 @@ class ProjectConfig:
     
     INTERPRETER_EMBEDDING_DIM = 256
     INTERPRETER_HIDDEN_DIM = 128
+    INTERPRETER_FEATURE_SETS = None     # None trains on parsed poses, or a subset of pose_features.FEATURE_SETS
 
 
 CONFIG = ProjectConfig()
@@ -5,9 +5,11 @@ from util.shutdown import shutdown
 from data_scraping.collect_dactyl import collect_dactyl
 from data_scraping.collect_categories import collect_categories
 from data_scraping.annotation_cleanup import clean_annotations
-from pose_estimation.estimate_poses import estimate_poses
+from pose_estimation.estimate_poses import estimate_poses, renders_offline
+from pose_estimation.render_annotations import render_annotated_videos
 from pose_estimation.fast_pose_annotation import fast_annotate
 from pose_estimation.pose_postprocessing import pose_postprocessing
+from pose_estimation.pose_features import compute_pose_features
 
 from translation.spoken_to_sign import spoken_to_sign
 
@@ -43,9 +45,13 @@ def main():
         clean_annotations()
     if CONFIG.POSE_ESTIMATION_ENABLED:
         estimate_poses()
+        if CONFIG.VIDEO_ANNOTATION_ENABLED and renders_offline():
+            render_annotated_videos()
         fast_annotate()
         if CONFIG.MERGE_POSES_TO_ONE_ARCHIVE:
             pose_postprocessing()
+            if CONFIG.POSE_FEATURES_ENABLED and CONFIG.POSE_DATASET_FORMAT == 'ragged':
+                compute_pose_features()
     if CONFIG.TRANSLATION_ENABLED:
         retry_continue(spoken_to_sign())
 
@@ -1,13 +1,15 @@
+import asyncio
+
 from config.config import CONFIG
 
 from util.global_logger import GLOBAL_LOGGER as LOG
 from util.path_resolver import PATH_RESOLVER as REPATH
 
-from data_scraping.scraping_util import request_page_contents, scrape_file
-from util.annotator import Annotator
+from data_scraping.page_cache import PAGE_CACHE
+from data_scraping.crawl_frontier import crawl, new_task, seq_key, VIDEO
 
 
-def find_all_videos(soup):
+async def find_all_videos(scraper, soup):
     video_tag = soup.find('video', recursive=True)
     if video_tag is None:
         return
@@ -17,108 +19,99 @@ def find_all_videos(soup):
     if not nav_bar:
         return [video_tag['src']]
 
-    video_srcs = []
-    for a in nav_bar.find_all('a', href=True):
-        video = request_page_contents(REPATH.resolve_relative_url(a['href']), tag='video')
-        if not video:
-            continue
-        video_src = video['src']
-        video_srcs.append(video_src)
+    # every nav tab is a separate page, they are requested concurrently and kept in tab order
+    videos = await asyncio.gather(*(
+        scraper.request_page_contents(REPATH.resolve_relative_url(a['href']), tag='video')
+        for a in nav_bar.find_all('a', href=True)
+    ))
+    return [video['src'] for video in videos if video]
+
+
+async def scrape_category_list(scraper, task):
+    LOG.info('Collecting category list')
+    unordered_list = await scraper.request_page_contents(task.url, tag='ul', tag_id='categories')
+    if not unordered_list:
+        LOG.error('No list found')
+        return
 
-    return video_srcs
+    pages = []
+    for position, li in enumerate(unordered_list.find_all('li')):
+        a = li.find('a', href=True)
+        category = a.text.strip()
+        start_page = REPATH.resolve_relative_url(a['href'])
+        category_seq = seq_key(task.seq, position)
+        pages.append(new_task('category_page', start_page, seq_key(category_seq, 1),
+                              {'category': category, 'category_seq': category_seq, 'start_page': start_page,
+                               'page': 1}))
+    return pages, []
 
 
-def scrape_category_page(url, category, annotator):
-    LOG.info(f'Collecting from {url}')
+async def scrape_category_page(scraper, task):
+    category, page = task.data['category'], task.data['page']
+    LOG.info(f'Collecting "{category}" page {page} from {task.url}')
 
-    words_list = request_page_contents(url, tag='div', tag_class='search-results')
+    words_list = await scraper.request_page_contents(task.url, tag='div', tag_class='search-results')
     if not words_list:
-        LOG.error(f'Content list not found: {url}')
+        LOG.error(f'Content list not found: {task.url}')
         return
 
-    for div in words_list.find_all('div', class_='search-result'):
+    found = []
+    for position, div in enumerate(words_list.find_all('div', class_='search-result')):
         a = div.find('a', href=True)
         word = a.contents[0].strip()
         part_of_speech = a.find('small')
         if part_of_speech:
             part_of_speech = part_of_speech.text.strip()
-        word_link = a["href"]
-        LOG.info(f'Scraping "{word}" ({part_of_speech}) at {word_link}')
-
-        word_content = request_page_contents(REPATH.resolve_relative_url(word_link),
-                                             tag='div', tag_class='search-result-content')
-        if not word_content:
-            LOG.warning(f'Search result content not found for "{word}" ({part_of_speech}) at {word_link}')
-            continue
-
-        video_srcs = find_all_videos(word_content)
-        if not video_srcs:
-            LOG.warning(f'No video sources found for "{word}" ({part_of_speech}) at {word_link}')
-            continue
-
-        for video_src in video_srcs:
-            output_abs_path = REPATH.WORD_RAW_DIR / REPATH.get_file_name(video_src)
-            output_rel_path = REPATH.resolve_project_relative_path(output_abs_path)
-            annotator.record(line=[word, part_of_speech, category, video_src, output_rel_path])
-
-            if REPATH.exists(output_abs_path):
-                LOG.info(f'File {output_rel_path} already exists')
-            else:
-                scrape_file(video_src, output_abs_path)
-
-    return words_list
-
-
-def category_scraper(start_page, skip_to_page, *args):
-    if skip_to_page:
-        url = REPATH.join_url_query(start_page, f'p={skip_to_page}')
-    else:
-        url = start_page
-
-    while True:
-        search_result = scrape_category_page(url, *args)
-        pager = search_result.find('div', class_='search-pager-next', recursive=True)
-        if not pager:
-            LOG.warning(f'Pager not found at {url}')
-            break
-        a = pager.find('a')
-        if not a:
-            LOG.info(f'Next page query not found at {url}, category scraping assumed complete')
-            break
-        query = a['href']
-        url = REPATH.join_url_query(start_page, query)
+        found.append(new_task('word', REPATH.resolve_relative_url(a['href']), seq_key(task.seq, position),
+                              {'word': word, 'part_of_speech': part_of_speech, 'category': category}))
+
+    pager = words_list.find('div', class_='search-pager-next', recursive=True)
+    if not pager:
+        LOG.warning(f'Pager not found at {task.url}')
+        return found, []
+    a = pager.find('a')
+    if not a:
+        LOG.info(f'Next page query not found at {task.url}, category scraping assumed complete')
+        return found, []
+
+    next_page = dict(task.data, page=page + 1)
+    found.append(new_task('category_page', REPATH.join_url_query(task.data['start_page'], a['href']),
+                          seq_key(task.data['category_seq'], page + 1), next_page))
+    return found, []
+
+
+async def scrape_word(scraper, task):
+    word, part_of_speech, category = task.data['word'], task.data['part_of_speech'], task.data['category']
+    LOG.info(f'Scraping "{word}" ({part_of_speech}) at {task.url}')
+
+    word_content = await scraper.request_page_contents(task.url, tag='div', tag_class='search-result-content')
+    if not word_content:
+        LOG.warning(f'Search result content not found for "{word}" ({part_of_speech}) at {task.url}')
+        return
 
+    video_srcs = await find_all_videos(scraper, word_content)
+    if not video_srcs:
+        LOG.warning(f'No video sources found for "{word}" ({part_of_speech}) at {task.url}')
+        return [], []
 
-def collect_categories():
-    LOG.info('Collecting category list')
-
-    page = REPATH.CATEGORY_PAGE
-    unordered_list = request_page_contents(page, tag='ul', tag_id='categories')
-    if not unordered_list:
-        LOG.error('No list found')
-        return
+    videos, rows = [], []
+    for position, video_src in enumerate(video_srcs):
+        output_abs_path = REPATH.WORD_RAW_DIR / REPATH.get_file_name(video_src)
+        output_rel_path = str(REPATH.resolve_project_relative_path(output_abs_path))
+        seq = seq_key(task.seq, position)
+        rows.append(('words.csv', seq, [word, part_of_speech, category, video_src, output_rel_path]))
+        # two words can share a video, it is downloaded once
+        videos.append(new_task(VIDEO, video_src, seq, {'output': output_rel_path}, key=f'{VIDEO}:{output_rel_path}'))
+    return videos, rows
 
-    LOG.info('Initiating word scraping')
-    annotator = Annotator(REPATH.ANNOTATION_DIR / 'words.csv')
 
-    skip_page = CONFIG.RESUME_FROM_CATEGORY_PAGE
-    for li in unordered_list.find_all('li'):
-        a = li.find('a', href=True)
-        category = a.text.strip()
-        start_page = REPATH.resolve_relative_url(a['href'])
+def collect_categories():
+    if CONFIG.PAGE_CACHE_ENABLED:
+        PAGE_CACHE.evict_expired()
 
-        # if we haven't skipped yet, need to skip, and the current category is wrong -> skip
-        if skip_page and CONFIG.RESUME_FROM_CATEGORY and CONFIG.RESUME_FROM_CATEGORY != category:
-            LOG.info(f'Skipping "{category}" at {start_page})')
-            continue
-
-        # if we found the specified category and used the page number, unset it, stopping the skipping
-        if CONFIG.RESUME_FROM_CATEGORY == category:
-            LOG.info(f'Starting word scraping for "{category}" (page {skip_page}) at {start_page}')
-            category_scraper(start_page, skip_page, category, annotator)
-            skip_page = None
-            continue
-
-        # in all other cases, scrape normally
-        LOG.info(f'Starting word scraping for "{category}" at {start_page}')
-        category_scraper(start_page, None, category, annotator)
+    LOG.info('Initiating word scraping')
+    crawl('category_list', REPATH.CATEGORY_PAGE, 'w', {
+        'category_list': scrape_category_list,
+        'category_page': scrape_category_page,
+        'word': scrape_word,
+    }, ['words.csv'])
@@ -3,40 +3,44 @@ from config.config import CONFIG
 from util.global_logger import GLOBAL_LOGGER as LOG
 from util.path_resolver import PATH_RESOLVER as REPATH
 
-from data_scraping.scraping_util import request_page_contents, scrape_file
-from util.annotator import Annotator
+from data_scraping.page_cache import PAGE_CACHE
+from data_scraping.crawl_frontier import crawl, new_task, seq_key, VIDEO
 
 
-def collect_dactyl():
-    if CONFIG.RESUME_FROM_CATEGORY:
-        LOG.info('Skipping scraping dactyl')
-        return
-
-    page = REPATH.ALPHABET_PAGE
-    LOG.info('Collecting alphabet from ' + page)
-
-    contents = request_page_contents(page, tag='ul', tag_class='alphabet-letter-list')
+async def scrape_alphabet(scraper, task):
+    contents = await scraper.request_page_contents(task.url, tag='ul', tag_class='alphabet-letter-list')
     if not contents:
         LOG.error('No alphabet found')
         return
 
-    annotator = Annotator(REPATH.ANNOTATION_DIR / 'dactyl.csv')
+    letters = [new_task('letter', REPATH.resolve_relative_url(a['href']), seq_key(task.seq, position),
+                        {'letter': a.text.strip()})
+               for position, a in enumerate(contents.find_all('a', href=True))]
+    return letters, []
 
-    for a in contents.find_all('a', href=True):
-        LOG.info(f'Scraping "{a.text.strip()}" at {a["href"]}')
-        video_div = request_page_contents(REPATH.resolve_relative_url(a['href']),
-                                          tag='div', tag_class='alphabet-letter-video')
-        if not video_div:
-            LOG.error(f'Failed to collect video for "{a.text.strip()}" at {a["href"]}')
-            continue
 
-        video_src = video_div.find('video')['src']
-        output_abs_path = REPATH.DACTYL_RAW_DIR / REPATH.get_file_name(video_src)
-        output_rel_path = REPATH.resolve_project_relative_path(output_abs_path)
+async def scrape_letter(scraper, task):
+    letter = task.data['letter']
+    LOG.info(f'Scraping "{letter}" at {task.url}')
+    video_div = await scraper.request_page_contents(task.url, tag='div', tag_class='alphabet-letter-video')
+    if not video_div:
+        LOG.error(f'Failed to collect video for "{letter}" at {task.url}')
+        return
+
+    video_src = video_div.find('video')['src']
+    output_abs_path = REPATH.DACTYL_RAW_DIR / REPATH.get_file_name(video_src)
+    output_rel_path = str(REPATH.resolve_project_relative_path(output_abs_path))
 
-        if REPATH.exists(output_abs_path):
-            LOG.info(f'File {output_rel_path} already exists')
-        else:
-            scrape_file(video_src, output_abs_path)
-            annotator.record(line=[a.text.strip(), None, 'dactyl', video_src, output_rel_path])
+    video = new_task(VIDEO, video_src, task.seq, {'output': output_rel_path}, key=f'{VIDEO}:{output_rel_path}')
+    return [video], [('dactyl.csv', task.seq, [letter, None, 'dactyl', video_src, output_rel_path])]
 
+
+def collect_dactyl():
+    if CONFIG.PAGE_CACHE_ENABLED:
+        PAGE_CACHE.evict_expired()
+
+    LOG.info('Collecting alphabet from ' + REPATH.ALPHABET_PAGE)
+    crawl('alphabet', REPATH.ALPHABET_PAGE, 'd', {
+        'alphabet': scrape_alphabet,
+        'letter': scrape_letter,
+    }, ['dactyl.csv'])
@@ -0,0 +1,319 @@
+"""
+Persistent crawl frontier, shared by every scraper process working on the same data directory.
+
+Each page and video to fetch is a task row in an SQLite database with its state: pending, in_flight, done or
+failed. Tasks are ordered by seq, a dotted key of zero-padded positions (category, page, word, video) that sorts
+like the site lists its content. A worker claims the lowest pending task, and finishes it by atomically storing
+the tasks it discovered and the annotation rows it produced. A crash therefore loses at most the tasks that
+were in flight. Live processes keep renewing the lease of their tasks, the tasks of a dead one are claimed
+again once their lease runs out.
+
+Annotation rows are kept in the database under the seq of the task that produced them, and exported to the
+annotation CSV files in seq order, so the files do not depend on which process scraped what or when.
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from config.config import CONFIG
+from util.global_logger import GLOBAL_LOGGER as LOG
+from util.path_resolver import PATH_RESOLVER as REPATH
+from util.annotator import Annotator
+
+from data_scraping.scraping_util import AsyncScraper, scrape_file, DOWNLOAD_POOL
+
+
+PENDING, IN_FLIGHT, DONE, FAILED = 'pending', 'in_flight', 'done', 'failed'
+VIDEO = 'video'
+
+Task = namedtuple('Task', ['id', 'kind', 'url', 'seq', 'data', 'attempts'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    key         TEXT NOT NULL UNIQUE,
+    kind        TEXT NOT NULL,
+    url         TEXT NOT NULL,
+    seq         TEXT NOT NULL,
+    data        TEXT NOT NULL DEFAULT '{}',
+    state       TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    updated     REAL,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (state, seq);
+CREATE TABLE IF NOT EXISTS rows (
+    file        TEXT NOT NULL,
+    seq         TEXT NOT NULL,
+    line        TEXT NOT NULL,
+    PRIMARY KEY (file, seq)
+);
+CREATE TABLE IF NOT EXISTS exports (
+    prefix      TEXT PRIMARY KEY,
+    latest      REAL
+);
+"""
+
+
+def seq_key(parent, position):
+    return f'{parent}.{position:05d}'
+
+
+def new_task(kind, url, seq, data=None, key=None):
+    """A discovered task, keyed on its seq unless another key deduplicates it (e.g. a video shared by words)"""
+    return {'kind': kind, 'url': url, 'seq': seq, 'data': data or {}, 'key': key or seq}
+
+
+class CrawlFrontier:
+    def __init__(self, path=None):
+        self.path = path if path is not None else REPATH.CRAWL_FRONTIER_DB
+        self.local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        # sqlite connections cannot be shared between threads, every thread opens its own
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connection()
+        # IMMEDIATE takes the write lock up front, so two processes never claim the same task
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def reset(self, prefix):
+        with self._transaction() as db:
+            db.execute("DELETE FROM tasks WHERE seq LIKE ? || '%'", (prefix,))
+            db.execute("DELETE FROM rows WHERE seq LIKE ? || '%'", (prefix,))
+            db.execute('DELETE FROM exports WHERE prefix = ?', (prefix,))
+
+    def seed(self, kind, url, prefix, retry_failed=False):
+        """Adds the root task of a crawl, a crawl that was already seeded continues where it stopped"""
+        with self._transaction() as db:
+            db.execute('INSERT OR IGNORE INTO tasks (key, kind, url, seq) VALUES (?, ?, ?, ?)',
+                       (prefix, kind, url, prefix))
+            if retry_failed:
+                db.execute(f"UPDATE tasks SET state = '{PENDING}', attempts = 0 "
+                           f"WHERE state = '{FAILED}' AND seq LIKE ? || '%'", (prefix,))
+
+    def claim(self, prefix, kinds, worker):
+        """Marks the lowest pending task of the given kinds under prefix as in flight, None if there is none"""
+        placeholders = ', '.join('?' * len(kinds))
+        expired = time.time() - CONFIG.FRONTIER_LEASE_SECONDS
+        with self._transaction() as db:
+            row = db.execute(
+                f"SELECT id, kind, url, seq, data, attempts FROM tasks "
+                f"WHERE (state = '{PENDING}' OR (state = '{IN_FLIGHT}' AND updated < ?)) "
+                f"AND seq LIKE ? || '%' AND kind IN ({placeholders}) ORDER BY seq LIMIT 1",
+                (expired, prefix, *kinds)).fetchone()
+            if row is None:
+                return None
+            db.execute(f"UPDATE tasks SET state = '{IN_FLIGHT}', worker = ?, updated = ? WHERE id = ?",
+                       (worker, time.time(), row[0]))
+        return Task(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5])
+
+    def complete(self, task, children=(), rows=()):
+        """Stores the discovered tasks and produced annotation rows, and marks the task done, all at once"""
+        with self._transaction() as db:
+            db.executemany('INSERT OR IGNORE INTO tasks (key, kind, url, seq, data) VALUES (?, ?, ?, ?, ?)',
+                           [(child['key'], child['kind'], child['url'], child['seq'],
+                             json.dumps(child['data'], ensure_ascii=False)) for child in children])
+            db.executemany('INSERT OR REPLACE INTO rows (file, seq, line) VALUES (?, ?, ?)',
+                           [(file, seq, json.dumps(line, ensure_ascii=False)) for file, seq, line in rows])
+            db.execute(f"UPDATE tasks SET state = '{DONE}', updated = ?, error = NULL WHERE id = ?",
+                       (time.time(), task.id))
+
+    def fail(self, task, error):
+        state = FAILED if task.attempts + 1 >= CONFIG.FRONTIER_MAX_ATTEMPTS else PENDING
+        with self._transaction() as db:
+            db.execute('UPDATE tasks SET state = ?, attempts = attempts + 1, updated = ?, error = ? WHERE id = ?',
+                       (state, time.time(), str(error), task.id))
+        if state == FAILED:
+            LOG.error(f'Giving up on {task.kind} {task.url} after {task.attempts + 1} attempts: {error}')
+
+    def renew(self, worker):
+        """Extends the lease of the tasks a process and its download threads have in flight"""
+        with self._transaction() as db:
+            db.execute(f"UPDATE tasks SET updated = ? "
+                       f"WHERE state = '{IN_FLIGHT}' AND (worker = ? OR worker LIKE ? || ':%')",
+                       (time.time(), worker, worker))
+
+    def active(self, prefix, kinds):
+        """Number of pending or in flight tasks of the given kinds under prefix, in any process"""
+        placeholders = ', '.join('?' * len(kinds))
+        return self._connection().execute(
+            f"SELECT COUNT(*) FROM tasks WHERE state IN ('{PENDING}', '{IN_FLIGHT}') "
+            f"AND seq LIKE ? || '%' AND kind IN ({placeholders})", (prefix, *kinds)).fetchone()[0]
+
+    def state(self, key):
+        row = self._connection().execute('SELECT state FROM tasks WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def counts(self, prefix):
+        return dict(self._connection().execute(
+            "SELECT state, COUNT(*) FROM tasks WHERE seq LIKE ? || '%' GROUP BY state", (prefix,)).fetchall())
+
+    def export_rows(self, prefix, files):
+        """
+        Rewrites the annotation files from the stored rows in seq order, once no task under prefix is left.
+        The export holds the write lock and records the last task update it saw, so of several processes
+        finishing together only the first exports, and one that finishes while others still crawl leaves it to them.
+        """
+        with self._transaction() as db:
+            unfinished = db.execute(f"SELECT COUNT(*) FROM tasks WHERE state IN ('{PENDING}', '{IN_FLIGHT}') "
+                                    f"AND seq LIKE ? || '%'", (prefix,)).fetchone()[0]
+            if unfinished:
+                LOG.info(f'{unfinished} tasks are still pending or in flight, the worker finishing them exports')
+                return
+
+            latest = db.execute("SELECT MAX(updated) FROM tasks WHERE seq LIKE ? || '%'", (prefix,)).fetchone()[0]
+            exported = db.execute('SELECT latest FROM exports WHERE prefix = ?', (prefix,)).fetchone()
+            if exported is not None and exported[0] == latest \
+                    and all(REPATH.exists(REPATH.ANNOTATION_DIR / file) for file in files):
+                LOG.info('Annotation files of this crawl are already exported')
+                return
+
+            for file in files:
+                self._export_file(db, file)
+            db.execute('INSERT OR REPLACE INTO exports (prefix, latest) VALUES (?, ?)', (prefix, latest))
+
+    @staticmethod
+    def _export_file(db, file):
+        out_path = REPATH.ANNOTATION_DIR / file
+        stored = db.execute('SELECT COUNT(*) FROM rows WHERE file = ?', (file,)).fetchone()[0]
+        if not stored:
+            LOG.warning(f'No annotation rows stored for {file}, {out_path} is left unchanged')
+            return
+
+        tmp_path = out_path.with_name(f'{out_path.name}.{os.getpid()}.tmp')
+        tmp_path.unlink(missing_ok=True)
+        annotator = Annotator(tmp_path)
+        for (line,) in db.execute('SELECT line FROM rows WHERE file = ? ORDER BY seq', (file,)):
+            annotator.record(line=json.loads(line))
+        annotator.csv_file.close()
+        os.replace(tmp_path, out_path)
+        LOG.info(f'Exported {stored} annotation rows to {out_path}')
+
+
+def _worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _download_videos(frontier, prefix, pages_done):
+    """Runs on DOWNLOAD_POOL, drains the video tasks until page scraping is over and no video is left"""
+    worker = f'{_worker_name()}:{threading.current_thread().name}'
+    while True:
+        task = frontier.claim(prefix, [VIDEO], worker)
+        if task is None:
+            if pages_done.is_set() and not frontier.active(prefix, [VIDEO]):
+                return
+            time.sleep(CONFIG.FRONTIER_POLL_SECONDS)
+            continue
+
+        output_file = REPATH.PROJECT_ROOT / task.data['output']
+        try:
+            if REPATH.exists(output_file):
+                LOG.info(f'File {task.data["output"]} already exists')
+                saved = True
+            else:
+                saved = scrape_file(task.url, output_file)
+        except Exception as e:
+            LOG.exception(f'Downloading {task.url} failed')
+            frontier.fail(task, repr(e))
+            continue
+        if saved:
+            frontier.complete(task)
+        else:
+            frontier.fail(task, 'download failed')
+
+
+async def _scrape_pages(frontier, prefix, handlers, scraper, worker):
+    kinds = list(handlers)
+    while True:
+        task = frontier.claim(prefix, kinds, worker)
+        if task is None:
+            # tasks in flight elsewhere may still discover more pages
+            if not frontier.active(prefix, kinds):
+                return
+            await asyncio.sleep(CONFIG.FRONTIER_POLL_SECONDS)
+            continue
+
+        try:
+            result = await handlers[task.kind](scraper, task)
+        except Exception as e:
+            LOG.exception(f'Scraping {task.kind} {task.url} failed')
+            frontier.fail(task, repr(e))
+            continue
+        if result is None:
+            frontier.fail(task, 'page content not found')
+            continue
+        children, rows = result
+        frontier.complete(task, children, rows)
+
+
+async def _renew_leases(frontier, worker):
+    while True:
+        await asyncio.sleep(CONFIG.FRONTIER_LEASE_SECONDS / 3)
+        frontier.renew(worker)
+
+
+async def _drain(frontier, prefix, handlers):
+    worker = _worker_name()
+    pages_done = threading.Event()
+    renewing = asyncio.create_task(_renew_leases(frontier, worker))
+    # videos download while pages are still being scraped
+    downloads = [asyncio.wrap_future(DOWNLOAD_POOL.submit(_download_videos, frontier, prefix, pages_done))
+                 for _ in range(CONFIG.DOWNLOAD_WORKERS)]
+    try:
+        async with AsyncScraper() as scraper:
+            await asyncio.gather(*(_scrape_pages(frontier, prefix, handlers, scraper, worker)
+                                   for _ in range(CONFIG.SCRAPING_PAGE_TASKS)))
+    finally:
+        pages_done.set()
+        await asyncio.gather(*downloads)
+        renewing.cancel()
+
+
+def crawl(root_kind, root_url, prefix, handlers, annotation_files):
+    """
+    Seeds the frontier with the root page, drains every task under prefix and exports the annotation rows.
+
+    :param root_kind:           kind of the root task, a key of handlers.
+    :param root_url:            URL of the root page.
+    :param prefix:              seq prefix of this crawl, e.g. 'w' for words and 'd' for dactyl.
+    :param handlers:            {kind: async handler(scraper, task)}, a handler returns (new tasks, annotation rows)
+                                or None when the page could not be scraped. Video tasks are downloaded directly.
+    :param annotation_files:    annotation files written from the stored rows.
+    """
+    frontier = CrawlFrontier()
+    if CONFIG.FRONTIER_RESET:
+        LOG.info(f'Resetting the crawl frontier of {root_url}')
+        frontier.reset(prefix)
+    frontier.seed(root_kind, root_url, prefix, retry_failed=CONFIG.FRONTIER_RETRY_FAILED)
+    LOG.info(f'Crawl frontier of {root_url}: {frontier.counts(prefix)}')
+
+    asyncio.run(_drain(frontier, prefix, handlers))
+
+    LOG.info(f'Crawl frontier of {root_url}: {frontier.counts(prefix)}')
+    # without the root page nothing was discovered, the annotation files stay as they are
+    if frontier.state(prefix) != DONE:
+        LOG.error(f'Failed to scrape {root_url}, annotation files are left unchanged')
+        return
+    frontier.export_rows(prefix, annotation_files)
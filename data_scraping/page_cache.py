@@ -0,0 +1,129 @@
+"""
+On-disk cache of fetched pages, shared by the blocking and the asyncio scraper.
+
+Every page is stored as <key>.body with a <key>.json entry holding its URL, Content-Type, ETag, Last-Modified
+and the time it was last confirmed. The key hashes the URL with the cookies and headers that change the page.
+
+A page confirmed less than PAGE_CACHE_FRESH_HOURS ago is served without a request. An older one is
+revalidated with If-None-Match / If-Modified-Since, and a 304 answer serves the cached body without
+downloading it again. Entries that were not confirmed for PAGE_CACHE_TTL_DAYS are evicted.
+"""
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+from config.config import CONFIG
+from util.global_logger import GLOBAL_LOGGER as LOG
+from util.path_resolver import PATH_RESOLVER as REPATH
+
+
+_KEY_HEADERS = ('Accept', 'Accept-Language')    # request headers that select a different page
+
+
+def _replace(path, data):
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PageCache:
+    def __init__(self, path=None, fresh_seconds=None, ttl_seconds=None):
+        self.path = Path(path) if path is not None else REPATH.PAGE_CACHE_DIR
+        self.fresh_seconds = CONFIG.PAGE_CACHE_FRESH_HOURS * 3600 if fresh_seconds is None else fresh_seconds
+        self.ttl_seconds = CONFIG.PAGE_CACHE_TTL_DAYS * 24 * 3600 if ttl_seconds is None else ttl_seconds
+
+    @staticmethod
+    def key(url, headers=None, cookies=None):
+        headers = headers or {}
+        varying = {name: headers[name] for name in _KEY_HEADERS if name in headers}
+        material = json.dumps([url, varying, cookies or {}], sort_keys=True)
+        return hashlib.blake2b(material.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _paths(self, key):
+        directory = self.path / key[:2]
+        return directory / f'{key}.json', directory / f'{key}.body'
+
+    def lookup(self, key):
+        """The cache entry of key, None if there is none or it expired"""
+        entry_path, body_path = self._paths(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if time.time() - entry['confirmed'] > self.ttl_seconds or not body_path.exists():
+            self._remove(key)
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return entry is not None and time.time() - entry['confirmed'] <= self.fresh_seconds
+
+    @staticmethod
+    def conditional_headers(entry):
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def body(self, key):
+        try:
+            with open(self._paths(key)[1], 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_entry(self, key, entry):
+        entry_path, _ = self._paths(key)
+        _replace(entry_path, json.dumps(entry).encode('utf-8'))
+
+    def store(self, key, url, content, response_headers):
+        entry_path, body_path = self._paths(key)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        # the body goes first, an entry never points at a missing body
+        _replace(body_path, content)
+        self._write_entry(key, {
+            'url': url,
+            'content_type': response_headers.get('Content-Type'),
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'confirmed': time.time(),
+        })
+
+    def revalidated(self, key, entry, response_headers):
+        """Records a 304 answer, the server may send new validators along"""
+        entry = dict(entry)
+        entry['etag'] = response_headers.get('ETag') or entry.get('etag')
+        entry['last_modified'] = response_headers.get('Last-Modified') or entry.get('last_modified')
+        entry['confirmed'] = time.time()
+        self._write_entry(key, entry)
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            path.unlink(missing_ok=True)
+
+    def evict_expired(self):
+        now = time.time()
+        evicted = 0
+        for entry_path in self.path.glob('*/*.json'):
+            try:
+                with open(entry_path, 'r', encoding='utf-8') as f:
+                    confirmed = json.load(f)['confirmed']
+            except (OSError, ValueError, KeyError):
+                confirmed = 0
+            if now - confirmed > self.ttl_seconds:
+                self._remove(entry_path.stem)
+                evicted += 1
+        if evicted:
+            LOG.info(f'Evicted {evicted} expired pages from the page cache')
+
+
+PAGE_CACHE = PageCache()
@@ -1,8 +1,16 @@
-from bs4 import BeautifulSoup
+import os
+import asyncio
+import aiohttp
+import requests
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.compat import chardet
 
 from config.config import CONFIG
 from util.global_logger import GLOBAL_LOGGER as LOG
-from util.global_ratelimiter import GLOBAL_SESSION as SESH
+from util.global_ratelimiter import GLOBAL_SESSION as SESH, GLOBAL_BUCKET as RATE_LIMITER
+from data_scraping.page_cache import PAGE_CACHE
 
 
 def request_page_contents(url, tag=None, tag_class=None, tag_id=None):
@@ -20,30 +28,71 @@ def request_page_contents(url, tag=None, tag_class=None, tag_id=None):
                         If specified without specifying the tag, has no effect.
     :return:            None | BeautifulSoup
     """
-    response = SESH.get(url, headers=CONFIG.HEADERS, cookies=CONFIG.COOKIES)
-    if response.status_code != 200:
-        LOG.warning(f'Failed to fetch page {url}')
+    key, entry, body = _cache_lookup(url)
+    if PAGE_CACHE.is_fresh(entry):
+        return page_contents(body, entry['content_type'], url, tag, tag_class, tag_id)
+
+    headers = {**CONFIG.HEADERS, **PAGE_CACHE.conditional_headers(entry)}
+    response = SESH.get(url, headers=headers, cookies=CONFIG.COOKIES)
+    content = _cached_response(key, entry, body, url, response.status_code, response.content, response.headers)
+    if content is None:
         return
 
-    content_type = response.headers.get('Content-Type')
+    content, content_type = content
+    return page_contents(content, content_type, url, tag, tag_class, tag_id)
+
+
+def _cache_lookup(url):
+    """(key, entry, body) of url in the page cache. An entry whose body is gone is a miss, the page is refetched"""
+    if not CONFIG.PAGE_CACHE_ENABLED:
+        return None, None, None
+    key = PAGE_CACHE.key(url, CONFIG.HEADERS, CONFIG.COOKIES)
+    entry = PAGE_CACHE.lookup(key)
+    body = PAGE_CACHE.body(key) if entry is not None else None
+    if body is None:
+        return key, None, None
+    return key, entry, body
+
+
+def _cached_response(key, entry, body, url, status, content, headers):
+    """(body, Content-Type) of a page response, read from or written to the page cache, None on failure"""
+    if status == 304 and entry is not None:
+        PAGE_CACHE.revalidated(key, entry, headers)
+        return body, entry['content_type']
+
+    if status != 200:
+        LOG.warning(f'Failed to fetch page {url}')
+        return None
+
+    if key is not None:
+        PAGE_CACHE.store(key, url, content, headers)
+    return content, headers.get('Content-Type')
+
+
+def _page_encoding(content, content_type):
     if content_type:
         # Check if 'charset' is specified in the Content-Type header
         content_type_parts = content_type.split('charset=')
         if len(content_type_parts) > 1:
-            # Set the encoding to the server-specified charset
-            server_encoding = content_type_parts[1].strip()
-            response.encoding = server_encoding
-        else:
-            # Fallback to apparent encoding if charset isn't specified
-            response.encoding = response.apparent_encoding
-    else:
-        # Fallback to apparent encoding if no Content-Type header is available
-        response.encoding = response.apparent_encoding
+            # Use the server-specified charset
+            return content_type_parts[1].split(';')[0].strip()
+    if CONFIG.SITE_ENCODING:
+        # the site's encoding is known, no need to sniff the whole body
+        return CONFIG.SITE_ENCODING
+    # Fallback to the apparent encoding, the same detection requests uses
+    return chardet.detect(content)['encoding'] or 'utf-8'
+
 
-    soup = BeautifulSoup(response.content.decode(response.encoding, errors='replace'), 'html.parser')
+def page_contents(content, content_type, url, tag=None, tag_class=None, tag_id=None):
+    """
+    Parses a fetched page body. Shared by the blocking and the asyncio scraper, see request_page_contents.
+    When a tag is requested, only matching tags and their contents are parsed into the tree.
+    """
+    encoding = _page_encoding(content, content_type)
+    markup = content.decode(encoding, errors='replace')
 
     if tag is None:
-        return soup
+        return BeautifulSoup(markup, CONFIG.HTML_PARSER)
 
     attrs = {}
     if tag_class:
@@ -51,6 +100,7 @@ def request_page_contents(url, tag=None, tag_class=None, tag_id=None):
     if tag_id:
         attrs['id'] = tag_id
 
+    soup = BeautifulSoup(markup, CONFIG.HTML_PARSER, parse_only=SoupStrainer(tag, attrs=attrs))
     contents = soup.find(tag, attrs=attrs, recursive=True)
     if not contents:
         LOG.warning(f'Failed to find tag <{tag}> of class "{tag_class}" and id "{tag_id}" at {url}')
@@ -59,14 +109,140 @@ def request_page_contents(url, tag=None, tag_class=None, tag_id=None):
     return contents
 
 
+class AsyncScraper:
+    """
+    aiohttp session for the asyncio scraper. Up to max_in_flight page requests run at once,
+    while the global token bucket keeps the overall request rate at CONFIG.REQUESTS_PER_SECOND.
+    """
+    def __init__(self, max_in_flight=None):
+        self.max_in_flight = max_in_flight or CONFIG.SCRAPING_MAX_IN_FLIGHT
+        self.session = None
+        self.in_flight = None
+
+    async def __aenter__(self):
+        # cookies are sent verbatim like requests does, aiohttp's cookie jar would quote the JSON value
+        cookie = '; '.join(f'{name}={value}' for name, value in CONFIG.COOKIES.items())
+        self.session = aiohttp.ClientSession(headers={**CONFIG.HEADERS, 'Cookie': cookie})
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def request_page_contents(self, url, tag=None, tag_class=None, tag_id=None):
+        """Asyncio counterpart of request_page_contents"""
+        key, entry, body = _cache_lookup(url)
+        if PAGE_CACHE.is_fresh(entry):
+            return page_contents(body, entry['content_type'], url, tag, tag_class, tag_id)
+
+        async with self.in_flight:
+            await RATE_LIMITER.acquire_async()
+            try:
+                async with self.session.get(url, headers=PAGE_CACHE.conditional_headers(entry)) as response:
+                    content = await response.read() if response.status == 200 else None
+                    status, headers = response.status, response.headers
+            except aiohttp.ClientError as e:
+                LOG.warning(f'Failed to fetch page {url}: {e}')
+                return
+
+        content = _cached_response(key, entry, body, url, status, content, headers)
+        if content is None:
+            return
+
+        content, content_type = content
+        return page_contents(content, content_type, url, tag, tag_class, tag_id)
+
+
+def _content_range(response):
+    """(start, total) from a Content-Range header, either is None if the server did not send it"""
+    # Content-Range: bytes <start>-<end>/<total or *> on a 206, bytes */<total> on a 416
+    byte_range = response.headers.get('Content-Range', '')
+    try:
+        span, total = byte_range.split(' ', 1)[1].split('/')
+    except (IndexError, ValueError):
+        return None, None
+    start = span.split('-')[0].strip()
+    total = total.strip()
+    return int(start) if start.isdigit() else None, int(total) if total.isdigit() else None
+
+
+def _download(src, part_file):
+    """
+    Streams src into part_file, continuing from its current size with a Range request.
+    Returns True once part_file holds the complete file.
+    """
+    offset = part_file.stat().st_size if part_file.exists() else 0
+    headers = dict(CONFIG.HEADERS)
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+
+    with SESH.get(src, headers=headers, cookies=CONFIG.COOKIES, stream=True,
+                  timeout=CONFIG.DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 416 and offset:
+            _, total = _content_range(response)
+            if total == offset:
+                # the partial file already holds the whole file, an earlier run stopped before renaming it
+                LOG.info(f'Partial download of {src} is already complete')
+                return True
+            # the partial file does not fit the remote file anymore, start over
+            part_file.unlink()
+            return _download(src, part_file)
+
+        if response.status_code == 206:
+            start, total = _content_range(response)
+            if start != offset:
+                LOG.warning(f'Server resumed {src} at byte {start} instead of {offset}, restarting download')
+                part_file.unlink()
+                return _download(src, part_file)
+            mode = 'ab'
+        elif response.status_code == 200:
+            # the server ignored the range, the body is the whole file
+            offset = 0
+            total = response.headers.get('Content-Length')
+            total = int(total) if total is not None else None
+            mode = 'wb'
+        else:
+            LOG.warning(f'Failed to fetch file from {src} (status {response.status_code})')
+            return False
+
+        if offset:
+            LOG.info(f'Resuming download of {src} at byte {offset}')
+        with open(part_file, mode) as file:
+            for chunk in response.iter_content(chunk_size=CONFIG.DOWNLOAD_CHUNK_SIZE):
+                file.write(chunk)
+
+    size = part_file.stat().st_size
+    if total is not None and size != total:
+        raise IOError(f'Download of {src} stopped at {size} of {total} bytes')
+    return True
+
+
 def scrape_file(src, output_file):
-    response = SESH.get(src, headers=CONFIG.HEADERS, cookies=CONFIG.COOKIES)
-    if response.status_code != 200:
-        LOG.warning(f'Failed to fetch file from {src}')
-        return
+    """
+    Downloads src to output_file. The body is streamed into a .part file next to output_file, which is renamed
+    to output_file only after its size matched Content-Length. Interrupted downloads leave the .part file behind
+    and continue from it, on a retry as well as on the next run.
+
+    :return: whether output_file was saved
+    """
+    output_file = Path(output_file)
+    part_file = output_file.with_name(output_file.name + '.part')
+
+    for attempt in range(1, CONFIG.DOWNLOAD_RETRIES + 1):
+        try:
+            if not _download(src, part_file):
+                return False
+            break
+        except (requests.RequestException, IOError) as e:
+            LOG.warning(f'Download attempt {attempt}/{CONFIG.DOWNLOAD_RETRIES} of {src} failed: {e}')
+    else:
+        LOG.error(f'Failed to download {src}, partial file kept at {part_file}')
+        return False
+
+    os.replace(part_file, output_file)
+    LOG.info(f'Saved file to {output_file}')
+    return True
+
 
-    with open(output_file, 'wb') as file:
-        # Write the content of the response to the file in chunks
-        for chunk in response.iter_content(chunk_size=8192):
-            file.write(chunk)
-        LOG.info(f'Saved file to {output_file}')
+# video downloads run on their own bounded pool, so they never hold up page fetches
+DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=CONFIG.DOWNLOAD_WORKERS, thread_name_prefix='download')
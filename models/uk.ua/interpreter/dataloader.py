@@ -1,14 +1,33 @@
 from numpy.random import shuffle
 
 import pickle
+import numpy as np
 import torch
 import torch.nn.utils.rnn as rnn_utils
 from torch.utils.data import DataLoader, Dataset, SubsetRandomSampler
 
+from config.config import CONFIG
 from util.path_resolver import PATH_RESOLVER as REPATH
-
-
-data = pickle.load(open(REPATH.POSE_DATA_DIR / 'full_pose_dataset.pkl', 'rb'))
+from util.global_logger import GLOBAL_LOGGER as LOG
+from pose_estimation.pose_dataset import RaggedPoseDataset, DATASET_DIR
+from pose_estimation.pose_features import PoseFeatures
+
+
+# the format pose postprocessing writes, a dataset of the other format left on disk may be stale
+if CONFIG.POSE_DATASET_FORMAT == 'ragged':
+    if not RaggedPoseDataset.exists():
+        raise FileNotFoundError(f'No ragged pose dataset at {DATASET_DIR}, run pose postprocessing first')
+    # poses are zero-copy slices of the memory-mapped frames array
+    ragged = RaggedPoseDataset()
+    poses = ragged
+    if CONFIG.INTERPRETER_FEATURE_SETS:
+        if PoseFeatures.exists():
+            poses = PoseFeatures(ragged, CONFIG.INTERPRETER_FEATURE_SETS)
+        else:
+            LOG.warning('No precomputed pose features found, training on parsed poses')
+    data = {'word': ragged.words, 'pose': poses, 'length': ragged.lengths.tolist()}
+else:
+    data = pickle.load(open(REPATH.POSE_DATA_DIR / 'full_pose_dataset.pkl', 'rb'))
 
 idx_to_word = {}
 vocab = {}
@@ -22,7 +41,8 @@ def collate_fn(batch):
     # Convert words to tensor indices (using a vocabulary or a pre-trained embedding lookup)
     word_tensor = torch.tensor([vocab[word] for word in words], dtype=torch.long)
     # Pad the pose sequences to the max length in this batch
-    pose_tensor = rnn_utils.pad_sequence([torch.tensor(p) for p in poses], batch_first=True)
+    pose_tensor = rnn_utils.pad_sequence([torch.from_numpy(np.array(p, dtype=np.float32)) for p in poses],
+                                         batch_first=True)
     # Length to binary tensor that uses 1 to indicate end-of-sequence
     length_tensor = []
     for length in lengths:
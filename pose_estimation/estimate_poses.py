@@ -1,10 +1,13 @@
 import os
 import cv2
+import functools
+import queue
+import multiprocessing
 import pandas as pd
 
 import mediapipe as mp
 from mediapipe.framework.formats import landmark_pb2
-from mediapipe.tasks.python.vision import HolisticLandmarkerOptions, HolisticLandmarker
+from mediapipe.tasks.python.vision import HolisticLandmarkerOptions
 import mediapipe.python.solutions.drawing_utils as mp_drawing
 
 from config.config import CONFIG
@@ -13,8 +16,18 @@ from util.path_resolver import PATH_RESOLVER as REPATH
 
 if __name__ == '__main__':
     from pose_scribe import pose_scribe
+    from landmarker import ReusableLandmarker
+    from pose_buffer import PoseBuffer
+    from frame_prefetch import FramePrefetcher
+    from pose_cache import PoseCache
+    from stage_timer import StageTimer, TimingReport
 else:
     from pose_estimation.pose_scribe import pose_scribe
+    from pose_estimation.landmarker import ReusableLandmarker
+    from pose_estimation.pose_buffer import PoseBuffer
+    from pose_estimation.frame_prefetch import FramePrefetcher
+    from pose_estimation.pose_cache import PoseCache
+    from pose_estimation.stage_timer import StageTimer, TimingReport
 
 _HOLISTIC_OPTIONS = HolisticLandmarkerOptions(**CONFIG.POSE_ESTIMATION_OPTIONS)
 _ANNOTATION_STYLES = CONFIG.VIDEO_ANNOTATION_STYLES
@@ -37,85 +50,80 @@ def draw_annotation(image, annotation):
     return image
 
 
-def holistic_process(input_, output):
-    _HOLISTIC = HolisticLandmarker.create_from_options(_HOLISTIC_OPTIONS)
+def _scaled_size(width, height, max_side):
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return round(width * scale), round(height * scale)
 
-    LOG.info(f'Processing video {input_}')
-    in_vid = cv2.VideoCapture(input_)
 
-    out_vid = None
-    if output:
-        frame_width = int(in_vid.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(in_vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        frame_rate = int(in_vid.get(cv2.CAP_PROP_FPS))
-        fourcc = cv2.VideoWriter.fourcc(*'mp4v')
-        out_vid = cv2.VideoWriter(output, fourcc, frame_rate, (frame_width, frame_height))
+def holistic_process(input_, output, landmarker, stride=None, max_side=None, timer=None):
+    timer = StageTimer(input_) if timer is None else timer
+    stride = CONFIG.POSE_FRAME_STRIDE if stride is None else stride
+    max_side = CONFIG.POSE_MAX_INPUT_SIDE if max_side is None else max_side
 
+    LOG.info(f'Processing video {input_}')
+    in_vid = cv2.VideoCapture(input_)
     if not in_vid.isOpened():
         LOG.error(f"Error opening video file {input_}")
+        in_vid.release()
         return
 
-    results = []
-    while in_vid.isOpened():
-        success, image = in_vid.read()
-        if not success:
-            LOG.info("Reached end of video")
-            break
-
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
-        holistic_result = _HOLISTIC.detect_for_video(mp_image, int(in_vid.get(cv2.CAP_PROP_POS_MSEC)))
-        results.append(holistic_result)
-
+    out_vid = None
+    try:
+        if output:
+            frame_width = int(in_vid.get(cv2.CAP_PROP_FRAME_WIDTH))
+            frame_height = int(in_vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            frame_rate = in_vid.get(cv2.CAP_PROP_FPS) / max(stride, 1)
+            fourcc = cv2.VideoWriter.fourcc(*'mp4v')
+            out_vid = cv2.VideoWriter(output, fourcc, frame_rate, _scaled_size(frame_width, frame_height, max_side))
+
+        landmarker.start_video()
+        frame_count = in_vid.get(cv2.CAP_PROP_FRAME_COUNT)
+        if CONFIG.STREAM_POSE_SERIALIZATION:
+            results = PoseBuffer(capacity=frame_count)
+        else:
+            results = []
+            frame_indices = []
+        with FramePrefetcher(in_vid, CONFIG.FRAME_PREFETCH_DEPTH, stride, max_side) as frames:
+            for index, image, timestamp in frames:
+                with timer.stage('detect'):
+                    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+                    holistic_result = landmarker.detect(mp_image, timestamp)
+
+                with timer.stage('serialize'):
+                    if CONFIG.STREAM_POSE_SERIALIZATION:
+                        results.append(holistic_result, index)
+                    else:
+                        results.append(holistic_result)
+                        frame_indices.append(index)
+
+                if out_vid is not None:
+                    with timer.stage('draw'):
+                        image = draw_annotation(image, holistic_result)
+                        out_vid.write(image)
+    finally:
+        # the prefetcher has stopped reading by now, so the capture can be released even if estimation failed
+        in_vid.release()
         if out_vid is not None:
-            image = draw_annotation(image, results[-1])
-            out_vid.write(image)
-
-    in_vid.release()
-    if out_vid is not None:
-        out_vid.release()
+            out_vid.release()
+
+    LOG.info(f"Reached end of video after {frames.total_frames} frames, {frames.frames} estimated")
+    if frames.depth > 0:
+        LOG.info(f"Frame prefetch waits: decoder {frames.decode_wait:.3f}s, landmarker {frames.consume_wait:.3f}s")
+    timer.frames = frames.total_frames
+    timer.add('decode', frames.decode_time)
+    timer.add('convert', frames.convert_time)
+    timer.add('decode_wait', frames.decode_wait)
+    timer.add('detect_wait', frames.consume_wait)
+
+    with timer.stage('serialize'):
+        if not CONFIG.STREAM_POSE_SERIALIZATION:
+            results = PoseBuffer.from_results(results, frame_indices)
+        results.interpolate_skipped(frames.total_frames)
     return results
 
 
-def serialize_holistic_results(frames):
-    def reduce(value):
-        if value is None or not CONFIG.REDUCE_POSE_PRECISION:
-            return value
-        return round(value, CONFIG.REDUCE_POSE_PRECISION)
-
-    def serialize_data(data):
-        if not data:
-            return None
-
-        if hasattr(data[0], 'category_name') and hasattr(data[0], 'score'):
-            return {datum.category_name : datum.score for datum in data}
-
-        return {
-            i: {
-                "x": reduce(landmark.x),
-                "y": reduce(landmark.y),
-                "z": reduce(getattr(landmark, 'z', None)),
-                "v": reduce(getattr(landmark, 'visibility', None)),
-                "p": reduce(getattr(landmark, 'presence', None))
-            }
-            for i, landmark in enumerate(data)
-        }
-
-    def serialize_frame(frame):
-        annot_dict = {}
-        for annot_type, save in CONFIG.SELECTED_POSE_ANNOTATIONS.items():
-            if not save:
-                continue
-
-            serialized_annot = serialize_data(getattr(frame, annot_type))
-            if serialized_annot:
-                annot_dict[annot_type] = serialized_annot
-
-        return annot_dict
-
-    return [serialize_frame(frame) for frame in frames]
-
-
 def reevaluate_poses(df):
     selection_path = REPATH.ANNOTATION_DIR / 'words_selected.csv'
     if not REPATH.exists(selection_path):
@@ -127,50 +135,176 @@ def reevaluate_poses(df):
     return selected_df
 
 
-def estimate_poses():
-    if not (CONFIG.POSE_ESTIMATION_SOURCE['dactyl'] or CONFIG.POSE_ESTIMATION_SOURCE['words']):
-        LOG.error("No pose estimation sources were selected")
-        return
-
-    dactyl = pd.read_csv(REPATH.ANNOTATION_DIR / 'dactyl.csv', delimiter=';') \
-        if CONFIG.POSE_ESTIMATION_SOURCE['dactyl'] else None
-    words = pd.read_csv(REPATH.ANNOTATION_DIR / 'words_clean.csv', delimiter=';') \
-        if CONFIG.POSE_ESTIMATION_SOURCE['words'] else None
+@functools.cache
+def renders_offline():
+    """Whether annotated videos are rendered from saved annotations, which needs their normalized landmark groups"""
+    if not CONFIG.VIDEO_ANNOTATION_OFFLINE:
+        return False
+    if not any(CONFIG.SELECTED_POSE_ANNOTATIONS.get(annot_type) for annot_type, *_ in _ANNOTATION_STYLES):
+        LOG.warning('None of the landmark groups in CONFIG.VIDEO_ANNOTATION_STYLES is selected in '
+                    'CONFIG.SELECTED_POSE_ANNOTATIONS, annotated videos are drawn during estimation instead')
+        return False
+    return True
 
-    combined = []
-    if dactyl is not None:
-        combined.append((dactyl, REPATH.DACTYL_POSE_DIR))
-    if words is not None:
-        words = reevaluate_poses(words)
-        combined.append((words, REPATH.WORD_POSE_DIR))
 
-    out_video_path = None
-    annotation_path = None
+def _pose_jobs(combined, cache):
     for df, save_path in combined:
         for path in df['local_path']:
             in_path = REPATH.PROJECT_ROOT / path
 
-            if CONFIG.VIDEO_ANNOTATION_ENABLED:
+            out_video_path = None
+            if CONFIG.VIDEO_ANNOTATION_ENABLED and not renders_offline():
                 out_video_path = save_path / in_path.name
                 if REPATH.exists(out_video_path) and not CONFIG.FORCE_VIDEO_ANNOTATION:
                     LOG.info(f"Video already exists: {out_video_path}")
                     out_video_path = None
 
             annotation_path = save_path / f'{in_path.stem}'
-            if not CONFIG.FORCE_POSE_ANNOTATION:
-                if pose_scribe.all_selected_types_exist(annotation_path):
+            if cache is not None:
+                # an enabled cache decides on its own, it knows whether the video, settings or model changed
+                if REPATH.exists(in_path) and cache.is_fresh(in_path, annotation_path):
                     annotation_path = None
+            elif not CONFIG.FORCE_POSE_ANNOTATION and pose_scribe.all_selected_types_exist(annotation_path):
+                annotation_path = None
 
             if out_video_path is None and annotation_path is None:
                 continue
 
-            result = holistic_process(in_path, out_video_path)
-            if result is None:
-                LOG.error(f"No valid annotation found for {in_path.name}")
-                continue
+            yield in_path, out_video_path, annotation_path
+
+
+def _estimate_video(landmarker, in_path, out_video_path, annotation_path):
+    timer = StageTimer(REPATH.resolve_project_relative_path(in_path))
+    try:
+        result = holistic_process(in_path, out_video_path, landmarker, timer=timer)
+    except Exception:
+        # a failed graph may hold stale timestamps or tracking state, start the next video on a fresh one
+        landmarker.close()
+        raise
+
+    if result is None:
+        LOG.error(f"No valid annotation found for {in_path.name}")
+        return False, None
+
+    if CONFIG.POSE_ANNOTATION_ENABLED and annotation_path is not None:
+        with timer.stage('serialize'):
+            data = result.to_frame()
+        with timer.stage('write'):
+            # the cache already decided this annotation is stale, so existing files must be overwritten
+            pose_scribe.write(data, annotation_path, force=CONFIG.POSE_CACHE_ENABLED or None)
+    return True, timer.report()
+
+
+def _record_result(cache, job, success):
+    in_path, _, annotation_path = job
+    if success and cache is not None and annotation_path is not None and CONFIG.POSE_ANNOTATION_ENABLED:
+        cache.record(in_path, annotation_path)
+
+
+def _pose_worker(job_queue, result_queue):
+    with ReusableLandmarker(_HOLISTIC_OPTIONS) as landmarker:
+        while True:
+            job = job_queue.get()
+            if job is None:
+                break
+
+            try:
+                success, timing = _estimate_video(landmarker, *job)
+            except Exception as e:
+                LOG.exception(f"Pose estimation failed for {job[0]}: {e}")
+                success, timing = False, None
+            result_queue.put((job, success, timing))
+
+
+def _estimate_serial(jobs, cache, timing_report):
+    failed = 0
+    with ReusableLandmarker(_HOLISTIC_OPTIONS) as landmarker:
+        for i, job in enumerate(jobs, start=1):
+            try:
+                success, timing = _estimate_video(landmarker, *job)
+            except Exception as e:
+                LOG.exception(f"Pose estimation failed for {job[0]}: {e}")
+                success, timing = False, None
+            _record_result(cache, job, success)
+            timing_report.add(timing)
+            if not success:
+                failed += 1
+            LOG.info(f'Pose estimation progress: {i}/{len(jobs)} videos, {failed} failed')
+
+
+def _estimate_parallel(jobs, workers, cache, timing_report):
+    ctx = multiprocessing.get_context('spawn')
+    job_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    for _ in range(workers):
+        job_queue.put(None)
+
+    LOG.info(f'Starting {workers} pose estimation workers for {len(jobs)} videos')
+    processes = [ctx.Process(target=_pose_worker, args=(job_queue, result_queue), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    done = 0
+    failed = 0
+    while done < len(jobs):
+        try:
+            job, success, timing = result_queue.get(timeout=5)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                LOG.error(f'All pose estimation workers exited with {len(jobs) - done} videos unprocessed')
+                break
+            continue
+
+        done += 1
+        _record_result(cache, job, success)
+        timing_report.add(timing)
+        if not success:
+            failed += 1
+        LOG.info(f'Pose estimation progress: {done}/{len(jobs)} videos, {failed} failed')
+
+    for process in processes:
+        process.join()
+
+
+def estimate_poses():
+    if not (CONFIG.POSE_ESTIMATION_SOURCE['dactyl'] or CONFIG.POSE_ESTIMATION_SOURCE['words']):
+        LOG.error("No pose estimation sources were selected")
+        return
+
+    dactyl = pd.read_csv(REPATH.ANNOTATION_DIR / 'dactyl.csv', delimiter=';') \
+        if CONFIG.POSE_ESTIMATION_SOURCE['dactyl'] else None
+    words = pd.read_csv(REPATH.ANNOTATION_DIR / 'words_clean.csv', delimiter=';') \
+        if CONFIG.POSE_ESTIMATION_SOURCE['words'] else None
+
+    combined = []
+    if dactyl is not None:
+        combined.append((dactyl, REPATH.DACTYL_POSE_DIR))
+    if words is not None:
+        words = reevaluate_poses(words)
+        combined.append((words, REPATH.WORD_POSE_DIR))
+
+    cache = PoseCache() if CONFIG.POSE_CACHE_ENABLED else None
+    jobs = list(_pose_jobs(combined, cache))
+    if not jobs:
+        LOG.info('All pose annotations are up to date, nothing to estimate')
+        if cache is not None:
+            cache.save()
+        return
 
-            if CONFIG.POSE_ANNOTATION_ENABLED:
-                pose_scribe.write(serialize_holistic_results(result), annotation_path)
+    workers = min(CONFIG.POSE_ESTIMATION_WORKERS, len(jobs))
+    timing_report = TimingReport('pose_estimation_timing')
+    try:
+        if workers > 1:
+            _estimate_parallel(jobs, workers, cache, timing_report)
+        else:
+            _estimate_serial(jobs, cache, timing_report)
+    finally:
+        if cache is not None:
+            cache.save()
+        timing_report.save(slowest=CONFIG.POSE_TIMING_SLOWEST)
 
 
 if __name__ == '__main__':
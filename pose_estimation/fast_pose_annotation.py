@@ -1,31 +1,67 @@
+import os
 import pandas as pd
 from util.path_resolver import PATH_RESOLVER as REPATH
 from util.global_logger import GLOBAL_LOGGER as LOG
 from config.config import CONFIG
 
 
+def _scan_files(directories):
+    """Project relative POSIX paths of the files in each directory, one os.scandir pass per directory"""
+    files = set()
+    for directory in directories:
+        try:
+            with os.scandir(REPATH.PROJECT_ROOT / directory) as entries:
+                files.update(f'{directory}/{entry.name}' for entry in entries if entry.is_file())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return files
+
+
+def _annotation_stems(local_paths):
+    """Project relative POSIX path of each video's pose annotation, without the file type suffix"""
+    # local paths are recorded with the separator of the machine that scraped them
+    posix = local_paths.astype('string').str.replace('\\', '/', regex=False)
+    posix = posix.str.replace('/raw/', '/pose/', n=1, regex=False)
+    return posix.str.replace(r'\.mp4$', '', regex=True)
+
+
+def annotation_column(file_type):
+    """Annotation table column holding the project relative path of each video's file_type pose annotation"""
+    return f'annotation{file_type.replace(".", "_")}'
+
+
 def fast_annotate():
-    def annotation_pather(path, filetype='.txt'):
-        path = path.replace('\\raw', '\\pose')
-        path = path.replace('.mp4', filetype)
-        if REPATH.exists(REPATH.PROJECT_ROOT / path):
-            return path
-        else:
-            return None
+    file_types = [file_type for file_type, save in CONFIG.POSE_ANNOTATION_FILE_TYPES.items() if save]
 
     files = ['dactyl.csv', 'words.csv', 'words_clean.csv']
+    tables = {}
     for file in files:
-        LOG.info(f'Annotating pose estimation files to {file}')
         annot_file = REPATH.ANNOTATION_DIR / file
-        df = pd.read_csv(annot_file, delimiter=';')
+        if not REPATH.exists(annot_file):
+            LOG.warning(f'Annotation file {annot_file} does not exist, skipping')
+            continue
+        tables[file] = pd.read_csv(annot_file, delimiter=';')
 
-        for file_type, save in CONFIG.POSE_ANNOTATION_FILE_TYPES.items():
-            if not save:
-                continue
-            column_name = f'annotation{file_type.replace(".", "_")}'
-            df[column_name] = df['local_path'].apply(annotation_pather, args=(file_type, ))
+    # the pose directories all annotation tables point into are listed once, up front
+    stems = {file: _annotation_stems(df['local_path']) for file, df in tables.items()}
+    directories = set()
+    for file_stems in stems.values():
+        directories.update(file_stems.dropna().str.rsplit('/', n=1).str[0].unique())
+    existing = pd.Index(list(_scan_files(sorted(directories))))
+    LOG.info(f'Indexed {len(existing)} files in {len(directories)} pose directories')
+
+    for file, df in tables.items():
+        LOG.info(f'Annotating pose estimation files to {file}')
+        annotated = df.copy()
+        for file_type in file_types:
+            column_name = annotation_column(file_type)
+            candidates = stems[file] + file_type
+            annotated[column_name] = candidates.where(candidates.isin(existing))
 
-        df.to_csv(annot_file, index=False, sep=';')
+        if annotated.fillna('').astype(str).equals(df.fillna('').astype(str)):
+            LOG.info(f'{file} is up to date')
+            continue
+        annotated.to_csv(REPATH.ANNOTATION_DIR / file, index=False, sep=';')
         LOG.info(f'Saved {file}')
 
 
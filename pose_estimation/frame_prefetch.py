@@ -0,0 +1,116 @@
+import cv2
+import queue
+import threading
+from time import perf_counter
+
+
+class FramePrefetcher:
+    """
+    Reads and converts frames of an opened cv2.VideoCapture ahead of the consumer.
+
+    With a positive depth, decoding and BGR->RGB conversion run on a background thread that fills a bounded queue
+    of (frame_index, rgb_image, timestamp_ms) tuples. With depth 0, frames are read inline. The time each side
+    spent blocked on the queue is tracked in decode_wait (queue full) and consume_wait (queue empty).
+
+    Only every stride-th frame is decoded, the others are just grabbed. Frames whose longest side exceeds max_side
+    are downscaled before conversion. total_frames counts every frame of the video, frames only the yielded ones.
+    """
+    _END = object()
+
+    def __init__(self, video, depth, stride=1, max_side=None):
+        self.video = video
+        self.depth = depth
+        self.stride = max(int(stride), 1)
+        self.max_side = max_side
+        self.frames = 0
+        self.total_frames = 0
+        self.decode_time = 0.0
+        self.convert_time = 0.0
+        self.decode_wait = 0.0
+        self.consume_wait = 0.0
+
+        self._queue = queue.Queue(maxsize=max(depth, 1))
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = None
+
+    def _read(self):
+        start = perf_counter()
+        while self.total_frames % self.stride:
+            if not self.video.grab():
+                return None
+            self.total_frames += 1
+
+        success, image = self.video.read()
+        self.decode_time += perf_counter() - start
+        if not success:
+            return None
+        index = self.total_frames
+        self.total_frames += 1
+        timestamp = self.video.get(cv2.CAP_PROP_POS_MSEC)
+
+        start = perf_counter()
+        if self.max_side and max(image.shape[:2]) > self.max_side:
+            scale = self.max_side / max(image.shape[:2])
+            size = (round(image.shape[1] * scale), round(image.shape[0] * scale))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        self.convert_time += perf_counter() - start
+        return index, image, timestamp
+
+    def _put(self, item):
+        start = perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.decode_wait += perf_counter() - start
+
+    def _decode_loop(self):
+        try:
+            while not self._stop.is_set():
+                frame = self._read()
+                if frame is None:
+                    break
+                self._put(frame)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(self._END)
+
+    def __iter__(self):
+        if self.depth <= 0:
+            while True:
+                frame = self._read()
+                if frame is None:
+                    return
+                self.frames += 1
+                yield frame
+
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self._thread.start()
+        while True:
+            start = perf_counter()
+            frame = self._queue.get()
+            self.consume_wait += perf_counter() - start
+            if frame is self._END:
+                break
+            self.frames += 1
+            yield frame
+
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
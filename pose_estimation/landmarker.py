@@ -0,0 +1,71 @@
+import mediapipe as mp
+import numpy as np
+from mediapipe.tasks.python.vision import HolisticLandmarker
+
+from config.config import CONFIG
+from util.global_logger import GLOBAL_LOGGER as LOG
+
+
+class ReusableLandmarker:
+    """
+    A long-lived HolisticLandmarker shared by all videos processed in one process.
+
+    VIDEO running mode demands strictly increasing timestamps over the whole life of a landmarker,
+    so each video is shifted past the last timestamp fed to the model. Pose, face and hand tracking carry
+    their regions of interest and landmark smoothing from frame to frame, so a blank frame is fed in the gap
+    before each reused video: nothing is detected on it, which drops the tracked regions and resets the
+    smoothing filters, and the video is estimated as if by a fresh landmarker.
+    The underlying landmarker is recreated every CONFIG.LANDMARKER_MAX_REUSE videos and after any failure,
+    and is closed on exit. Verify with python -m benchmarks.check_landmarker_reset.
+    """
+    VIDEO_GAP_MS = 1000     # gap between two consecutive videos on the landmarker timeline
+
+    def __init__(self, options, max_reuse=None):
+        self.options = options
+        self.max_reuse = CONFIG.LANDMARKER_MAX_REUSE if max_reuse is None else max_reuse
+        self._landmarker = None
+        self._videos = 0
+        self._offset = 0
+        self._last_timestamp = -1
+        self._reset_pending = False
+
+    def start_video(self):
+        if self._landmarker is not None and self.max_reuse and self._videos >= self.max_reuse:
+            LOG.debug(f'Recreating landmarker after {self._videos} videos')
+            self.close()
+
+        if self._landmarker is None:
+            self._landmarker = HolisticLandmarker.create_from_options(self.options)
+            self._videos = 0
+            self._last_timestamp = -1
+            self._offset = 0
+            self._reset_pending = False
+        else:
+            self._offset = self._last_timestamp + self.VIDEO_GAP_MS
+            self._reset_pending = True
+        self._videos += 1
+
+    def _reset_tracking(self, image):
+        # the blank frame must match the video size, tracked regions are normalized to the frame
+        blank = mp.Image(image_format=image.image_format, data=np.zeros_like(image.numpy_view()))
+        self._landmarker.detect_for_video(blank, self._offset - self.VIDEO_GAP_MS // 2)
+        self._reset_pending = False
+
+    def detect(self, image, timestamp_ms):
+        if self._reset_pending:
+            self._reset_tracking(image)
+        # video timestamps may repeat or stall on broken containers, so never step back on the timeline
+        timestamp = max(self._offset + int(timestamp_ms), self._last_timestamp + 1)
+        self._last_timestamp = timestamp
+        return self._landmarker.detect_for_video(image, timestamp)
+
+    def close(self):
+        if self._landmarker is not None:
+            self._landmarker.close()
+            self._landmarker = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,81 @@
+"""
+Binary pose annotation container.
+
+Layout:     MAGIC | uint8 major | uint8 minor | uint32 header length | JSON header | raw C-order array
+The JSON header holds the column names, dtype and shape, and is padded so the array starts on a 64-byte
+boundary. The array can then be mapped straight from disk with np.memmap, the same way np.load(mmap_mode='r')
+maps a .npy file.
+"""
+import os
+import json
+import struct
+import numpy as np
+from pathlib import Path
+
+
+MAGIC = b'POSEBN'
+VERSION = (1, 0)
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct('<6sBBI')
+
+
+def write_pose_binary(path, array, columns, **extra):
+    array = np.ascontiguousarray(array)
+    header = {
+        'columns': list(columns),
+        'dtype': array.dtype.str,
+        'shape': list(array.shape),
+        **extra
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    padding = -(_PREAMBLE.size + len(header_bytes) + 1) % ALIGNMENT
+    header_bytes += b' ' * padding + b'\n'
+
+    # an interrupted write leaves the temporary file behind, never a truncated file readers would trust
+    path = Path(path)
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, *VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        array.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_pose_binary_header(f):
+    name = getattr(f, 'name', f)
+    preamble = f.read(_PREAMBLE.size)
+    if len(preamble) < _PREAMBLE.size:
+        raise ValueError(f'Pose binary file is empty or truncated: {name}')
+    magic, major, minor, header_length = _PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ValueError(f'Not a pose binary file: {name}')
+    if major != VERSION[0]:
+        raise ValueError(f'Unsupported pose binary version {major}.{minor}')
+
+    header_bytes = f.read(header_length)
+    if len(header_bytes) < header_length:
+        raise ValueError(f'Pose binary header is truncated: {name}')
+    header = json.loads(header_bytes.decode('utf-8'))
+    return header, _PREAMBLE.size + header_length
+
+
+def load_pose_binary(path, mmap_mode='r'):
+    """
+    :param path:        Path to the binary pose file.
+    :param mmap_mode:   np.memmap mode, or None to read the whole array into memory.
+    :return:            (array, header)
+    """
+    with open(path, 'rb') as f:
+        header, offset = read_pose_binary_header(f)
+        dtype = np.dtype(header['dtype'])
+        shape = tuple(header['shape'])
+        expected = offset + int(np.prod(shape)) * dtype.itemsize
+        if os.fstat(f.fileno()).st_size < expected:
+            raise ValueError(f'Pose binary array is truncated: {path}')
+
+        if mmap_mode is None or 0 in shape:
+            f.seek(offset)
+            array = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            return array, header
+
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape), header
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from config.config import CONFIG
+from pose_estimation.pose_schema import group_shape, group_columns, selected_groups, BLENDSHAPE_NAMES
+
+
+class PoseBuffer:
+    """
+    Preallocated per-group landmark arrays that take holistic results one frame at a time.
+
+    Every selected annotation group gets a float32 array of shape (frames, landmarks, channels), filled with one
+    array assignment per group and frame. Undetected values stay NaN. The flat column schema comes from pose_schema
+    and is the same for every clip, whatever was detected in it.
+    Frames may be appended sparsely by index, the rows in between are filled by interpolate_skipped().
+    """
+    def __init__(self, capacity=0, groups=None):
+        self.groups = selected_groups() if groups is None else list(groups)
+        self.capacity = max(int(capacity), 1)
+        self.arrays = {
+            annot_type: np.full((self.capacity, *group_shape(annot_type)), np.nan, dtype=np.float32)
+            for annot_type in self.groups
+        }
+        self._blendshape_index = {name: i for i, name in enumerate(BLENDSHAPE_NAMES)}
+        self.frames = 0
+        self.processed = []
+
+    @classmethod
+    def from_results(cls, results, frame_indices=None):
+        buffer = cls(capacity=len(results))
+        if frame_indices is None:
+            frame_indices = range(len(results))
+        for result, frame in zip(results, frame_indices):
+            buffer.append(result, frame)
+        return buffer
+
+    def __len__(self):
+        return self.frames
+
+    def _grow(self):
+        for annot_type, array in self.arrays.items():
+            self.arrays[annot_type] = np.concatenate([array, np.full_like(array, np.nan)], axis=0)
+        self.capacity *= 2
+
+    def append(self, result, frame=None):
+        if frame is None:
+            frame = self.frames
+        while frame >= self.capacity:
+            self._grow()
+        self.frames = max(self.frames, frame + 1)
+        self.processed.append(frame)
+
+        for annot_type in self.groups:
+            data = getattr(result, annot_type)
+            if not data:
+                continue
+
+            array = self.arrays[annot_type]
+            if annot_type == 'face_blendshapes':
+                pairs = [(self._blendshape_index[category.category_name], category.score)
+                         for category in data if category.category_name in self._blendshape_index]
+                if pairs:
+                    index, scores = zip(*pairs)
+                    array[frame, list(index), 0] = scores
+                continue
+
+            # None coordinates become NaN in a float array
+            data = data[:array.shape[1]]
+            array[frame, :len(data)] = np.array(
+                [(lm.x, lm.y, getattr(lm, 'z', None), getattr(lm, 'visibility', None), getattr(lm, 'presence', None))
+                 for lm in data],
+                dtype=np.float32
+            )
+
+    def interpolate_skipped(self, total_frames=None):
+        """
+        Fills frames that were never appended by linear interpolation between the nearest appended frames.
+        A value stays NaN unless it was detected on both sides, frames past the last appended one repeat it.
+        """
+        if total_frames is not None:
+            while total_frames > self.capacity:
+                self._grow()
+            self.frames = max(self.frames, total_frames)
+
+        processed = np.unique(self.processed)
+        if not len(processed) or len(processed) == self.frames:
+            return
+
+        index = np.arange(self.frames)
+        skipped = np.setdiff1d(index, processed)
+        left = processed[np.clip(np.searchsorted(processed, skipped, side='right') - 1, 0, None)]
+        right = processed[np.clip(np.searchsorted(processed, skipped, side='left'), None, len(processed) - 1)]
+        span = right - left
+        weight = np.divide(skipped - left, span, out=np.zeros(len(skipped)), where=span > 0).astype(np.float32)
+        weight = weight[:, None, None]
+
+        for array in self.arrays.values():
+            array[skipped] = (1 - weight) * array[left] + weight * array[right]
+
+    def group_array(self, annot_type):
+        array = self.arrays[annot_type][:self.frames]
+        if CONFIG.REDUCE_POSE_PRECISION:
+            array = np.round(array, CONFIG.REDUCE_POSE_PRECISION)
+        return array
+
+    def to_frame(self):
+        columns = []
+        blocks = []
+        for annot_type in self.groups:
+            columns.extend(group_columns(annot_type))
+            blocks.append(self.group_array(annot_type).reshape(self.frames, -1))
+        if not blocks:
+            return pd.DataFrame()
+        return pd.DataFrame(np.concatenate(blocks, axis=1), columns=columns)
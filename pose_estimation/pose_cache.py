@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+from config.config import CONFIG
+from util.global_logger import GLOBAL_LOGGER as LOG
+from util.path_resolver import PATH_RESOLVER as REPATH
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def estimation_settings():
+    """Every setting that changes the content of a pose annotation, except the model file itself"""
+    options = {key: value for key, value in CONFIG.POSE_ESTIMATION_OPTIONS.items() if key != 'base_options'}
+    return {
+        'options': options,
+        'selected_annotations': CONFIG.SELECTED_POSE_ANNOTATIONS,
+        'reduce_precision': CONFIG.REDUCE_POSE_PRECISION,
+        'storage_precision': CONFIG.POSE_STORAGE_PRECISION,
+        'frame_stride': CONFIG.POSE_FRAME_STRIDE,
+        'max_input_side': CONFIG.POSE_MAX_INPUT_SIDE,
+    }
+
+
+class PoseCache:
+    """
+    Manifest of estimated videos, keyed on a hash of the video content, the estimation settings and the model file.
+
+    A pose annotation is fresh when its stored key matches the current inputs and every selected annotation file
+    still has the size and hash recorded when it was written. Video hashes are reused while the file size and
+    modification time are unchanged.
+    """
+    def __init__(self, path=None):
+        self.path = Path(path) if path else REPATH.POSE_DATA_DIR / 'pose_cache.json'
+        self.videos = {}
+        self.annotations = {}
+        self._pending = 0
+        if REPATH.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                self.videos = manifest.get('videos', {})
+                self.annotations = manifest.get('annotations', {})
+            except (ValueError, OSError) as e:
+                LOG.error(f'Pose cache manifest {self.path} is unreadable, starting a new one: {e}')
+
+        model_path = CONFIG.POSE_ESTIMATION_OPTIONS['base_options'].model_asset_path
+        settings = json.dumps(estimation_settings(), sort_keys=True, default=str)
+        self.settings_key = hashlib.blake2b(settings.encode('utf-8'), digest_size=16).hexdigest()
+        self.model_key = file_hash(model_path) if model_path and REPATH.exists(model_path) else None
+
+    @staticmethod
+    def _key(path):
+        return REPATH.resolve_project_relative_path(path).as_posix()
+
+    def video_hash(self, video_path):
+        stat = os.stat(video_path)
+        entry = self.videos.get(self._key(video_path))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['hash']
+
+        video_hash = file_hash(video_path)
+        self.videos[self._key(video_path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': video_hash}
+        return video_hash
+
+    def input_key(self, video_path):
+        return f'{self.video_hash(video_path)}:{self.settings_key}:{self.model_key}'
+
+    @staticmethod
+    def _outputs(annotation_path):
+        for file_type, perform_write in CONFIG.POSE_ANNOTATION_FILE_TYPES.items():
+            if perform_write:
+                yield file_type, annotation_path.parent / (annotation_path.name + file_type)
+
+    def is_fresh(self, video_path, annotation_path):
+        entry = self.annotations.get(self._key(annotation_path))
+        if entry is None or entry['key'] != self.input_key(video_path):
+            return False
+
+        for file_type, typed_path in self._outputs(annotation_path):
+            output = entry['outputs'].get(file_type)
+            if output is None or not REPATH.exists(typed_path):
+                return False
+            if os.path.getsize(typed_path) != output['size']:
+                LOG.warning(f'Pose annotation changed size since it was written: {typed_path}')
+                return False
+            if CONFIG.POSE_CACHE_VERIFY_OUTPUTS and file_hash(typed_path) != output['hash']:
+                LOG.warning(f'Pose annotation is corrupted: {typed_path}')
+                return False
+        return True
+
+    def record(self, video_path, annotation_path):
+        outputs = {}
+        for file_type, typed_path in self._outputs(annotation_path):
+            if REPATH.exists(typed_path):
+                outputs[file_type] = {'size': os.path.getsize(typed_path), 'hash': file_hash(typed_path)}
+        self.annotations[self._key(annotation_path)] = {'key': self.input_key(video_path), 'outputs': outputs}
+
+        self._pending += 1
+        if self._pending >= 100:
+            self.save()
+
+    def save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'videos': self.videos, 'annotations': self.annotations}, f)
+        os.replace(tmp_path, self.path)
+        self._pending = 0
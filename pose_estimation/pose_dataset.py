@@ -0,0 +1,170 @@
+"""
+Ragged pose dataset: clip frames stored in contiguous float32 chunk files, indexed per clip.
+
+Directory layout:
+    frames_<chunk>.npy  float32 (frames, features) chunks, memory-mapped on load
+    clips.npy           per clip (chunk, offset, length), the clip is frames_<chunk>[offset:offset + length]
+    words.json          word of every clip, in clip order
+    columns.json        feature column names
+    manifest.json       annotation row (source file and word) -> fingerprint and clip index, for incremental builds
+
+A build writes only the newly parsed clips into a new chunk and points reused clips at their existing chunks.
+Once too much of the chunk data belongs to removed clips, the live clips are compacted into a single chunk.
+"""
+import os
+import json
+import numpy as np
+from pathlib import Path
+
+from util.path_resolver import PATH_RESOLVER as REPATH
+from util.global_logger import GLOBAL_LOGGER as LOG
+
+
+DATASET_DIR = REPATH.POSE_DATA_DIR / 'full_pose_dataset'
+CLIP_DTYPE = np.dtype([('chunk', np.int32), ('offset', np.int64), ('length', np.int64)])
+REUSE = object()    # marks a clip to be taken over from the existing dataset instead of a parsed pose
+
+
+def _chunk_path(path, chunk):
+    return path / f'frames_{chunk:05d}.npy'
+
+
+def _chunk_ids(path):
+    ids = (file.name[len('frames_'):-len('.npy')] for file in path.glob('frames_*.npy'))
+    return sorted(int(chunk) for chunk in ids if chunk.isdigit())
+
+
+def _replace_json(data, path):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _load_json(path, default=None):
+    if not REPATH.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_chunk(path, chunk, poses, features):
+    """Writes poses one after another into a new chunk file, returns their offsets"""
+    lengths = np.array([len(pose) for pose in poses], dtype=np.int64)
+    offsets = np.zeros(len(poses) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # the chunk is filled clip by clip on disk, so the dataset is never held in memory twice
+    tmp_path = path / f'frames_{chunk:05d}.tmp.npy'
+    frames = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(int(offsets[-1]), features))
+    for i, pose in enumerate(poses):
+        frames[offsets[i]:offsets[i + 1]] = pose
+    frames.flush()
+    del frames
+    os.replace(tmp_path, _chunk_path(path, chunk))
+    return offsets[:-1]
+
+
+def manifest_key(source, word):
+    """Manifest entry of an annotation row, two words can share the clip of one source file"""
+    return f'{source}|{word}'
+
+
+def load_manifest(path=DATASET_DIR):
+    return _load_json(Path(path) / 'manifest.json', default={})
+
+
+def load_columns(path=DATASET_DIR):
+    return _load_json(Path(path) / 'columns.json')
+
+
+def update_ragged_dataset(clips, columns, path=DATASET_DIR, compact_ratio=0.25):
+    """
+    :param clips:           ordered (source, word, fingerprint, pose) tuples. pose is a parsed frames array,
+                            None or empty for a failed parse, or REUSE to keep the clip the manifest has for the
+                            source and word.
+    :param columns:         feature column names.
+    :param path:            dataset directory.
+    :param compact_ratio:   share of dead chunk frames above which all live clips are rewritten into one chunk.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    old_sources = load_manifest(path).get('sources', {})
+    old = RaggedPoseDataset(path) if RaggedPoseDataset.exists(path) else None
+
+    chunk_ids = _chunk_ids(path)
+    new_chunk = chunk_ids[-1] + 1 if chunk_ids else 0
+    parsed = [pose for _, _, _, pose in clips if pose is not REUSE and pose is not None and len(pose)]
+    parsed_offsets = iter(_write_chunk(path, new_chunk, parsed, len(columns)) if parsed else ())
+
+    records = []
+    words = []
+    sources = {}
+    for source, word, fingerprint, pose in clips:
+        key = manifest_key(source, word)
+        if pose is REUSE:
+            clip = old_sources[key]['clip']
+            record = None if clip is None else tuple(old.clips[clip])
+        elif pose is None or not len(pose):
+            record = None
+        else:
+            record = (new_chunk, next(parsed_offsets), len(pose))
+
+        sources[key] = {'source': source, 'word': word, 'fingerprint': fingerprint,
+                        'clip': None if record is None else len(records)}
+        if record is not None:
+            records.append(record)
+            words.append(word)
+    records = np.array(records, dtype=CLIP_DTYPE)
+
+    live_frames = int(records['length'].sum())
+    chunk_frames = {chunk: len(np.load(_chunk_path(path, chunk), mmap_mode='r'))
+                    for chunk in np.unique(records['chunk'])}
+    total_frames = sum(chunk_frames.values())
+    if total_frames and 1 - live_frames / total_frames > compact_ratio:
+        LOG.info(f'Compacting pose dataset, {total_frames - live_frames} of {total_frames} chunk frames are dead')
+        chunks = {chunk: np.load(_chunk_path(path, chunk), mmap_mode='r') for chunk in chunk_frames}
+        poses = (chunks[chunk][offset:offset + length] for chunk, offset, length in records)
+        compact_chunk = new_chunk + 1
+        records['offset'] = _write_chunk(path, compact_chunk, list(poses), len(columns))
+        records['chunk'] = compact_chunk
+        del chunks, poses
+
+    np.save(path / 'clips.tmp.npy', records)
+    os.replace(path / 'clips.tmp.npy', path / 'clips.npy')
+    _replace_json(words, path / 'words.json')
+    _replace_json(list(columns), path / 'columns.json')
+    _replace_json({'sources': sources}, path / 'manifest.json')
+
+    # memory maps of the previous build must be released before its chunk files can be removed
+    del old
+    referenced = set(np.unique(records['chunk']).tolist())
+    for chunk in _chunk_ids(path):
+        if chunk not in referenced:
+            _chunk_path(path, chunk).unlink()
+
+    LOG.info(f'Pose dataset holds {len(records)} clips, {live_frames} frames, '
+             f'{len(parsed)} clips parsed in this build')
+
+
+class RaggedPoseDataset:
+    """Memory-mapped ragged pose dataset, a clip is a zero-copy slice of its chunk"""
+    def __init__(self, path=DATASET_DIR, mmap_mode='r'):
+        path = Path(path)
+        self.clips = np.load(path / 'clips.npy')
+        self.lengths = self.clips['length']
+        self.chunks = {chunk: np.load(_chunk_path(path, chunk), mmap_mode=mmap_mode)
+                       for chunk in np.unique(self.clips['chunk']).tolist()}
+        self.words = _load_json(path / 'words.json')
+        self.columns = _load_json(path / 'columns.json')
+
+    @staticmethod
+    def exists(path=DATASET_DIR):
+        return all(REPATH.exists(Path(path) / name) for name in ('clips.npy', 'words.json', 'columns.json'))
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, idx):
+        chunk, offset, length = self.clips[idx]
+        return self.chunks[chunk][offset:offset + length]
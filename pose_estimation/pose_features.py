@@ -0,0 +1,221 @@
+"""
+Derived pose features, precomputed for the whole ragged dataset and stored next to its frames.
+
+Feature sets, in stored column order:
+    blendshapes     face blendshape scores as parsed
+    pose_scaled     pose world landmarks centered on the shoulder midpoint and divided by the shoulder width
+    hands_relative  hand world landmarks relative to their wrist, divided by the shoulder width, 0 for a missing hand
+    velocity        frame to frame difference of pose_scaled and hands_relative within a clip, 0 on the first frame
+                    of a clip and wherever a hand is missing in either frame
+
+The features of frames_<chunk>.npy are stored in features_v<version>/features_<chunk>.npy with the same frame
+layout, so the clip index of the ragged dataset addresses them as well. Changing the computation means bumping
+FEATURE_VERSION, which leaves older feature directories to be removed on the next build.
+"""
+import os
+import json
+import shutil
+import numpy as np
+from pathlib import Path
+
+from util.path_resolver import PATH_RESOLVER as REPATH
+from util.global_logger import GLOBAL_LOGGER as LOG
+from pose_estimation.pose_schema import LANDMARK_COUNTS, group_columns
+from pose_estimation.pose_dataset import RaggedPoseDataset, DATASET_DIR
+
+
+FEATURE_VERSION = 1
+FEATURE_SETS = ('blendshapes', 'pose_scaled', 'hands_relative', 'velocity')
+
+_XYZ = ['x', 'y', 'z']
+_HANDS = ('right_hand_world_landmarks', 'left_hand_world_landmarks')
+_LEFT_SHOULDER, _RIGHT_SHOULDER = 11, 12
+_MIN_SHOULDER_WIDTH = 1e-3
+_BLOCK_FRAMES = 1 << 16
+
+
+def _feature_dir(path=DATASET_DIR):
+    return Path(path) / f'features_v{FEATURE_VERSION}'
+
+
+def _feature_path(path, chunk):
+    return path / f'features_{chunk:05d}.npy'
+
+
+def _chunk_fingerprint(frames):
+    return [len(frames), os.stat(frames.filename).st_mtime_ns]
+
+
+def feature_columns():
+    """Column names of every feature set"""
+    pose = [column.replace('pose_world_landmarks', 'pose_scaled', 1)
+            for column in group_columns('pose_world_landmarks', _XYZ)]
+    hands = [column.replace('world_landmarks', 'relative', 1)
+             for hand in _HANDS for column in group_columns(hand, _XYZ)]
+    return {
+        'blendshapes': group_columns('face_blendshapes'),
+        'pose_scaled': pose,
+        'hands_relative': hands,
+        'velocity': [f'velocity.{column}' for column in pose + hands],
+    }
+
+
+class _Layout:
+    """Positions of the raw columns the features are computed from"""
+    def __init__(self, columns):
+        position = {column: i for i, column in enumerate(columns)}
+        self.blendshapes = [position[column] for column in group_columns('face_blendshapes')]
+        self.pose = self._landmarks(position, 'pose_world_landmarks')
+        self.hands = [self._landmarks(position, hand) for hand in _HANDS]
+
+    @staticmethod
+    def _landmarks(position, annot_type):
+        return np.array([[position[f'{annot_type}.{i}.{c}'] for c in _XYZ]
+                         for i in range(LANDMARK_COUNTS[annot_type])])
+
+
+def compute_features(frames, layout, clip_starts):
+    """
+    :param frames:      (frames, columns) parsed poses, consecutive frames of the same clip are adjacent.
+    :param layout:      _Layout of the frame columns.
+    :param clip_starts: (frames,) bool, True on the first frame of a clip.
+    :return:            (frames, features) float32, in feature_columns() order.
+    """
+    frames = np.asarray(frames, dtype=np.float32)
+    count = len(frames)
+
+    pose = frames[:, layout.pose]
+    shoulders = pose[:, [_LEFT_SHOULDER, _RIGHT_SHOULDER]]
+    center = shoulders.mean(axis=1, keepdims=True)
+    width = np.linalg.norm(shoulders[:, 0] - shoulders[:, 1], axis=-1)
+    width = np.where(width > _MIN_SHOULDER_WIDTH, width, 1)[:, None, None]
+    pose_scaled = ((pose - center) / width).reshape(count, -1)
+
+    hands = []
+    hand_missing = []
+    for hand_index in layout.hands:
+        hand = frames[:, hand_index]
+        missing = (hand == -1).all(axis=(1, 2))
+        relative = (hand - hand[:, :1]) / width
+        relative[missing] = 0
+        hands.append(relative.reshape(count, -1))
+        hand_missing.append(missing)
+
+    positions = np.concatenate([pose_scaled, *hands], axis=1)
+    velocity = np.zeros_like(positions)
+    velocity[1:] = positions[1:] - positions[:-1]
+    velocity[clip_starts] = 0
+
+    start = pose_scaled.shape[1]
+    for hand, missing in zip(hands, hand_missing):
+        end = start + hand.shape[1]
+        either_missing = missing.copy()
+        either_missing[1:] |= missing[:-1]
+        velocity[either_missing, start:end] = 0
+        start = end
+
+    return np.concatenate([frames[:, layout.blendshapes], positions, velocity], axis=1)
+
+
+def _write_chunk_features(out_path, frames, layout, clip_starts, features):
+    tmp_path = out_path.with_name(out_path.stem + '.tmp.npy')
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(len(frames), features))
+    # blocks start one frame early, so velocities across block boundaries stay intact
+    for start in range(0, len(frames), _BLOCK_FRAMES):
+        end = min(start + _BLOCK_FRAMES, len(frames))
+        lead = 1 if start else 0
+        block = compute_features(frames[start - lead:end], layout, clip_starts[start - lead:end])
+        out[start:end] = block[lead:]
+    out.flush()
+    del out
+    os.replace(tmp_path, out_path)
+
+
+def compute_pose_features(path=DATASET_DIR):
+    """Computes the features of every dataset chunk that changed since the last run"""
+    path = Path(path)
+    if not RaggedPoseDataset.exists(path):
+        LOG.warning(f'No ragged pose dataset at {path}, skipping feature precomputation')
+        return
+
+    for old_dir in path.glob('features_v*'):
+        if old_dir.is_dir() and old_dir != _feature_dir(path):
+            LOG.info(f'Removing outdated pose features {old_dir.name}')
+            shutil.rmtree(old_dir)
+
+    dataset = RaggedPoseDataset(path)
+    layout = _Layout(dataset.columns)
+    columns = feature_columns()
+    features = sum(len(names) for names in columns.values())
+    feature_dir = _feature_dir(path)
+    feature_dir.mkdir(exist_ok=True)
+
+    meta_path = feature_dir / 'features.json'
+    old_chunks = {}
+    if REPATH.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            old_chunks = json.load(f)['chunks']
+
+    chunks = {}
+    computed = 0
+    for chunk, frames in dataset.chunks.items():
+        fingerprint = _chunk_fingerprint(frames)
+        out_path = _feature_path(feature_dir, chunk)
+        chunks[str(chunk)] = fingerprint
+        if old_chunks.get(str(chunk)) == fingerprint and REPATH.exists(out_path):
+            continue
+
+        clip_starts = np.zeros(len(frames), dtype=bool)
+        clip_starts[dataset.clips['offset'][dataset.clips['chunk'] == chunk]] = True
+        _write_chunk_features(out_path, frames, layout, clip_starts, features)
+        computed += 1
+
+    live_paths = {_feature_path(feature_dir, chunk) for chunk in dataset.chunks}
+    for out_path in feature_dir.glob('features_*.npy'):
+        if out_path not in live_paths:
+            out_path.unlink()
+
+    tmp_path = meta_path.with_name(meta_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': FEATURE_VERSION, 'columns': columns, 'chunks': chunks}, f)
+    os.replace(tmp_path, meta_path)
+    LOG.info(f'Pose features v{FEATURE_VERSION}: {computed} of {len(chunks)} chunks computed, '
+             f'{features} features per frame')
+
+
+class PoseFeatures:
+    """Selected feature sets of every clip of a RaggedPoseDataset, indexed like the dataset itself"""
+    def __init__(self, dataset, sets=FEATURE_SETS, path=DATASET_DIR, mmap_mode='r'):
+        feature_dir = _feature_dir(path)
+        with open(feature_dir / 'features.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        unknown = set(sets) - set(FEATURE_SETS)
+        if unknown:
+            raise ValueError(f'Unknown pose feature sets {sorted(unknown)}, expected some of {FEATURE_SETS}')
+        outdated = [chunk for chunk, frames in dataset.chunks.items()
+                    if meta['chunks'].get(str(chunk)) != _chunk_fingerprint(frames)]
+        if meta['version'] != FEATURE_VERSION or outdated:
+            raise ValueError(f'Pose features in {feature_dir} are outdated, run compute_pose_features()')
+
+        self.dataset = dataset
+        self.columns = [column for name in FEATURE_SETS if name in sets for column in meta['columns'][name]]
+
+        all_columns = [column for name in FEATURE_SETS for column in meta['columns'][name]]
+        selected = [i for i, column in enumerate(all_columns) if column in set(self.columns)]
+        # every set selected keeps the clips as zero-copy slices
+        self.selected = None if len(selected) == len(all_columns) else np.array(selected)
+        self.chunks = {chunk: np.load(_feature_path(feature_dir, chunk), mmap_mode=mmap_mode)
+                       for chunk in dataset.chunks}
+
+    @staticmethod
+    def exists(path=DATASET_DIR):
+        return REPATH.exists(_feature_dir(path) / 'features.json')
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        chunk, offset, length = self.dataset.clips[idx]
+        features = self.chunks[chunk][offset:offset + length]
+        return features if self.selected is None else features[:, self.selected]
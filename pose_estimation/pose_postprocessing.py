@@ -1,73 +1,26 @@
+import os
 import pickle
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 
+from config.config import CONFIG
 from util.path_resolver import PATH_RESOLVER as REPATH
 from util.global_logger import GLOBAL_LOGGER as LOG
 from pose_estimation.pose_scribe import pose_scribe
-
-from warnings import simplefilter
-simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
+from pose_estimation.fast_pose_annotation import annotation_column
+from pose_estimation.pose_schema import group_columns
+from pose_estimation.pose_dataset import (RaggedPoseDataset, update_ragged_dataset, load_manifest, load_columns,
+                                          manifest_key, DATASET_DIR, REUSE)
+from pose_estimation.pose_store import PoseStore, write_pose_store, STORE_DIR
 
 
 xyz = ['x', 'y', 'z']
 
-face_cols = list("""
-    face_blendshapes._neutral
-    face_blendshapes.browDownLeft
-    face_blendshapes.browDownRight
-    face_blendshapes.browInnerUp
-    face_blendshapes.browOuterUpLeft
-    face_blendshapes.browOuterUpRight
-    face_blendshapes.cheekPuff
-    face_blendshapes.cheekSquintLeft
-    face_blendshapes.cheekSquintRight
-    face_blendshapes.eyeBlinkLeft
-    face_blendshapes.eyeBlinkRight
-    face_blendshapes.eyeLookDownLeft
-    face_blendshapes.eyeLookDownRight
-    face_blendshapes.eyeLookInLeft
-    face_blendshapes.eyeLookInRight
-    face_blendshapes.eyeLookOutLeft
-    face_blendshapes.eyeLookOutRight
-    face_blendshapes.eyeLookUpLeft
-    face_blendshapes.eyeLookUpRight
-    face_blendshapes.eyeSquintLeft
-    face_blendshapes.eyeSquintRight
-    face_blendshapes.eyeWideLeft
-    face_blendshapes.eyeWideRight
-    face_blendshapes.jawForward
-    face_blendshapes.jawLeft
-    face_blendshapes.jawOpen
-    face_blendshapes.jawRight
-    face_blendshapes.mouthClose
-    face_blendshapes.mouthDimpleLeft
-    face_blendshapes.mouthDimpleRight
-    face_blendshapes.mouthFrownLeft
-    face_blendshapes.mouthFrownRight
-    face_blendshapes.mouthFunnel
-    face_blendshapes.mouthLeft
-    face_blendshapes.mouthLowerDownLeft
-    face_blendshapes.mouthLowerDownRight
-    face_blendshapes.mouthPressLeft
-    face_blendshapes.mouthPressRight
-    face_blendshapes.mouthPucker
-    face_blendshapes.mouthRight
-    face_blendshapes.mouthRollLower
-    face_blendshapes.mouthRollUpper
-    face_blendshapes.mouthShrugLower
-    face_blendshapes.mouthShrugUpper
-    face_blendshapes.mouthSmileLeft
-    face_blendshapes.mouthSmileRight
-    face_blendshapes.mouthStretchLeft
-    face_blendshapes.mouthStretchRight
-    face_blendshapes.mouthUpperUpLeft
-    face_blendshapes.mouthUpperUpRight
-    face_blendshapes.noseSneerLeft
-    face_blendshapes.noseSneerRight
-""".split())
-pose_cols = [f'pose_world_landmarks.{i}.{c}' for i in range(33) for c in xyz]
-right_cols = [f'right_hand_world_landmarks.{i}.{c}' for i in range(21) for c in xyz]
-left_cols = [f'left_hand_world_landmarks.{i}.{c}' for i in range(21) for c in xyz]
+face_cols = group_columns('face_blendshapes')
+pose_cols = group_columns('pose_world_landmarks', xyz)
+right_cols = group_columns('right_hand_world_landmarks', xyz)
+left_cols = group_columns('left_hand_world_landmarks', xyz)
 
 hand_cols = right_cols
 hand_cols.extend(left_cols)
@@ -78,55 +31,198 @@ valid_cols = []
 valid_cols.extend(non_hand_cols)
 valid_cols.extend(hand_cols)
 
+# valid_cols is laid out as [non-hand | hand]
+_hand_start = len(non_hand_cols)
+# annotation groups the parser needs, columnar files load nothing else
+_parser_groups = list(dict.fromkeys(col.split('.', 1)[0] for col in valid_cols))
+
+
+def _interpolate_nans(values):
+    """
+    Linear interpolation of NaNs down each column, with the nearest value repeated past both ends.
+    Same arithmetic as np.interp, which pandas uses for interpolate(method='linear', limit_direction='both').
+    """
+    valid = ~np.isnan(values)
+    frames = len(values)
+    index = np.arange(frames)[:, None]
+
+    prev = np.maximum.accumulate(np.where(valid, index, -1), axis=0)
+    next_ = np.minimum.accumulate(np.where(valid, index, frames)[::-1], axis=0)[::-1]
+    prev = np.where(prev < 0, next_, prev)
+    next_ = np.where(next_ >= frames, prev, next_)
+
+    # columns without a single valid value stay NaN
+    fillable = ~valid & (prev < frames)
+    prev = np.minimum(prev, frames - 1)
+    next_ = np.minimum(next_, frames - 1)
+
+    prev_values = np.take_along_axis(values, prev, axis=0)
+    next_values = np.take_along_axis(values, next_, axis=0)
+    span = next_ - prev
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (next_values - prev_values) / span
+        interpolated = np.where(span > 0, slope * (index - prev) + prev_values, prev_values)
+
+    values[fillable] = interpolated[fillable]
+    return values
+
+
+def parse_pose_frame(raw_df, as_array=False):
+    # reindex to the fixed schema in one go, valid columns missing from raw data are filled with blanks
+    values = raw_df.reindex(columns=valid_cols, fill_value=-1).to_numpy(dtype=np.float64, copy=True)
+    # fixed schema files store values never detected in the clip as NaN columns, they count as missing too
+    values[:, np.isnan(values).all(axis=0)] = -1
+    non_hand = values[:, :_hand_start]
+    hand = values[:, _hand_start:]
+
+    # fill invalid values
+    if np.isnan(non_hand).any():
+        values[:, :_hand_start] = _interpolate_nans(non_hand)
+    hand[np.isnan(hand)] = -1
+
+    # trim the rows where both left and right hands are not in frame
+    values = values[~(hand == -1).all(axis=1)]
+    # trim 2 frames in and out if the clip is not too short
+    if len(values) >= 20:
+        values = values[2:-2]
+
+    return values if as_array else values.tolist()
 
-def pose_parser(path):
+
+def pose_parser(path, as_array=False):
     # load existing data
-    raw_df = pose_scribe.read(path)
+    raw_df = pose_scribe.read(path, groups=_parser_groups)
+    if isinstance(raw_df, list):
+        # nested json records
+        raw_df = pd.json_normalize(raw_df)
     if raw_df is None or raw_df.empty:
         return
 
-    # if a valid column doesn't exist in raw data, create it and fill with blanks
-    for col in valid_cols:
-        if col not in raw_df.columns:
-            raw_df[col] = -1
+    return parse_pose_frame(raw_df, as_array)
 
-    # create valid df
-    valid_df = raw_df[valid_cols].copy()
 
-    # fill invalid values
-    if valid_df[non_hand_cols].isna().any().any():
-        valid_df.loc[:, non_hand_cols] = valid_df[non_hand_cols].interpolate(method='linear', limit_direction='both', axis=0)
-    if valid_df[hand_cols].isna().any().any():
-        valid_df.loc[:, hand_cols] = valid_df[hand_cols].fillna(-1)
+def _logged_pose_parser(path):
+    LOG.info(f'Post-processing {path}')
+    return pose_parser(path, as_array=CONFIG.POSE_DATASET_FORMAT == 'ragged')
+
+
+def _parse_all(paths):
+    workers = CONFIG.POSE_POSTPROCESSING_WORKERS
+    if workers <= 1:
+        return map(_logged_pose_parser, paths)
+
+    # executor.map yields results in submission order, keeping words, poses and lengths aligned
+    LOG.info(f'Post-processing {len(paths)} annotations with {workers} workers')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_logged_pose_parser, paths, chunksize=max(1, len(paths) // (workers * 16))))
 
-    # trim the rows where both left and right hands are not in frame
-    valid_df = valid_df[~valid_df[hand_cols].eq(-1).all(axis=1)]
-    # trim 2 frames in and out if the clip is not too short
-    if len(valid_df) >= 20:
-        valid_df = valid_df[2:-2]
 
-    return valid_df.astype(float).values.tolist()
+def _sources(annotation):
+    """Annotation file of every row, the first in pose_scribe.read_preference() the row has, None if it has none"""
+    columns = [annotation_column(file_type) for file_type in pose_scribe.read_preference()]
+    columns = [column for column in columns if column in annotation.columns]
+    return [next((path for path in row if pd.notna(path)), None)
+            for row in annotation[columns].itertuples(index=False)]
+
+
+def _fingerprint(path):
+    if not REPATH.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _build_ragged_dataset(annotation):
+    incremental = CONFIG.POSE_DATASET_INCREMENTAL and RaggedPoseDataset.exists() and load_columns() == valid_cols
+    old_sources = load_manifest().get('sources', {}) if incremental else {}
+
+    plan = []
+    to_parse = []
+    for word, path in zip(annotation['word'], annotation['source']):
+        source = str(path).replace('\\', '/')
+        fingerprint = _fingerprint(REPATH.PROJECT_ROOT / path)
+        old = old_sources.get(manifest_key(source, word))
+        reuse = old is not None and fingerprint is not None and old['fingerprint'] == fingerprint
+        plan.append((source, word, fingerprint, reuse))
+        if not reuse:
+            to_parse.append(source)
+
+    keys = [manifest_key(source, word) for source, word, *_ in plan]
+    removed = len(set(old_sources) - set(keys))
+    LOG.info(f'Pose dataset build: {len(plan) - len(to_parse)} clips unchanged, {len(to_parse)} to parse, '
+             f'{removed} removed')
+    if incremental and not to_parse and list(old_sources) == keys:
+        LOG.info(f'Pose dataset at {DATASET_DIR} is up to date')
+        return False
+
+    # words sharing a video share its annotation file, it is parsed once
+    unique = list(dict.fromkeys(to_parse))
+    parsed = dict(zip(unique, _parse_all([REPATH.PROJECT_ROOT / source for source in unique])))
+    clips = []
+    for source, word, fingerprint, reuse in plan:
+        pose = REUSE if reuse else parsed[source]
+        if pose is not REUSE and (pose is None or not len(pose)):
+            LOG.warning(f'Parsing "{word}": {source} failed')
+        clips.append((source, word, fingerprint, pose))
+
+    LOG.info(f'Saving poses to {DATASET_DIR}')
+    update_ragged_dataset(clips, valid_cols, compact_ratio=CONFIG.POSE_DATASET_COMPACT_RATIO)
+    return True
+
+
+def _ragged_store_entries(annotation):
+    """(kind, word, pose) of every annotation row that made it into the ragged dataset"""
+    dataset = RaggedPoseDataset()
+    sources = load_manifest().get('sources', {})
+    for kind, word, path in zip(annotation['kind'], annotation['word'], annotation['source']):
+        clip = sources.get(manifest_key(str(path).replace('\\', '/'), word), {}).get('clip')
+        if clip is not None:
+            yield kind, word, dataset[clip]
+
+
+def _save_pose_store(entries):
+    LOG.info(f'Saving word-indexed poses to {STORE_DIR}')
+    write_pose_store(entries, valid_cols, shards=CONFIG.POSE_STORE_SHARDS)
 
 
 def pose_postprocessing():
     annotation_d = pd.read_csv(REPATH.ANNOTATION_DIR / 'dactyl.csv', delimiter=';')
     annotation_w = pd.read_csv(REPATH.ANNOTATION_DIR / 'words_clean.csv', delimiter=';')
     annotation = pd.concat([annotation_d, annotation_w], axis=0, ignore_index=True)
+    annotation['kind'] = ['dactyl'] * len(annotation_d) + ['word'] * len(annotation_w)
+
+    # clips estimated by different versions can have their poses in different formats, each row picks its own
+    annotation['source'] = _sources(annotation)
+    missing = annotation['source'].isna()
+    if missing.any():
+        LOG.warning(f'{missing.sum()} annotation rows have no pose annotation file and are skipped')
+        annotation = annotation[~missing].reset_index(drop=True)
+
+    if CONFIG.POSE_DATASET_FORMAT == 'ragged':
+        updated = _build_ragged_dataset(annotation)
+        if CONFIG.POSE_STORE_ENABLED and (updated or not PoseStore.exists()):
+            _save_pose_store(_ragged_store_entries(annotation))
+        return
 
     words = []
     poses = []
     lengths = []
+    store_entries = []
 
-    for word, path in zip(annotation['word'], annotation['annotation_csv_pkl']):
-        LOG.info(f'Post-processing {path}')
-        parsed = pose_parser(REPATH.PROJECT_ROOT / path)
+    sources = annotation['source']
+    paths = [REPATH.PROJECT_ROOT / path for path in sources]
+    for word, kind, path, parsed in zip(annotation['word'], annotation['kind'], sources, _parse_all(paths)):
         if parsed is not None and len(parsed) > 0:
             words.append(word)
             poses.append(parsed)
             lengths.append(len(parsed))
+            store_entries.append((kind, word, parsed))
         else:
             LOG.warning(f'Parsing "{word}": {path} failed')
 
+    if CONFIG.POSE_STORE_ENABLED:
+        _save_pose_store(store_entries)
+
     full_data = {
         'word': words,
         'pose': poses,
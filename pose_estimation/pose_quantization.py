@@ -0,0 +1,70 @@
+"""
+Storage precision of pose annotation arrays.
+
+float32 and float16 are stored as is. int16 is fixed point with a scale and offset per annotation group:
+value = q * scale + offset, with q in [-32767, 32767] and -32768 reserved for missing (NaN) values.
+The quantization parameters travel with the file, so readers dequantize back to float32 transparently.
+"""
+import numpy as np
+
+
+PRECISIONS = ('float32', 'float16', 'int16')
+INT16_NAN = np.iinfo(np.int16).min
+INT16_MAX = np.iinfo(np.int16).max
+
+
+def column_group(column):
+    return str(column).split('.', 1)[0]
+
+
+def _group_indices(columns):
+    groups = {}
+    for i, column in enumerate(columns):
+        groups.setdefault(column_group(column), []).append(i)
+    return groups
+
+
+def quantize(array, columns, precision='float32'):
+    """
+    :param array:       (frames, columns) float array
+    :param columns:     column names, grouped by their first dotted part
+    :param precision:   one of PRECISIONS
+    :return:            (stored array, quantization metadata or None)
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown pose storage precision {precision}, expected one of {PRECISIONS}')
+    array = np.asarray(array, dtype=np.float32)
+    if precision != 'int16':
+        return array.astype(precision, copy=False), None
+
+    stored = np.full(array.shape, INT16_NAN, dtype=np.int16)
+    params = {}
+    for group, indices in _group_indices(columns).items():
+        values = array[:, indices]
+        finite = np.isfinite(values)
+        if finite.any():
+            low, high = float(values[finite].min()), float(values[finite].max())
+        else:
+            low = high = 0.0
+        offset = (high + low) / 2
+        scale = (high - low) / (2 * INT16_MAX) or 1.0
+        with np.errstate(invalid='ignore'):
+            q = np.rint((values.astype(np.float64) - offset) / scale)
+        stored[:, indices] = np.where(finite, np.clip(q, -INT16_MAX, INT16_MAX), INT16_NAN)
+        params[group] = [scale, offset]
+
+    return stored, {'precision': precision, 'groups': params}
+
+
+def dequantize(array, columns, quantization=None):
+    """Inverse of quantize for any subset of the stored columns, always returns float32"""
+    if quantization is None:
+        return np.asarray(array).astype(np.float32, copy=False)
+
+    array = np.asarray(array)
+    values = np.empty(array.shape, dtype=np.float32)
+    for group, indices in _group_indices(columns).items():
+        scale, offset = quantization['groups'][group]
+        stored = array[:, indices]
+        values[:, indices] = np.where(stored == INT16_NAN, np.nan, stored * scale + offset)
+    return values
@@ -0,0 +1,41 @@
+from config.config import CONFIG
+
+
+LANDMARK_COUNTS = {
+    'face_landmarks'                : 478,
+    'pose_landmarks'                : 33,
+    'pose_world_landmarks'          : 33,
+    'left_hand_landmarks'           : 21,
+    'left_hand_world_landmarks'     : 21,
+    'right_hand_landmarks'          : 21,
+    'right_hand_world_landmarks'    : 21,
+}
+LANDMARK_CHANNELS = ('x', 'y', 'z', 'v', 'p')
+
+BLENDSHAPE_NAMES = """
+    _neutral browDownLeft browDownRight browInnerUp browOuterUpLeft browOuterUpRight cheekPuff cheekSquintLeft
+    cheekSquintRight eyeBlinkLeft eyeBlinkRight eyeLookDownLeft eyeLookDownRight eyeLookInLeft eyeLookInRight
+    eyeLookOutLeft eyeLookOutRight eyeLookUpLeft eyeLookUpRight eyeSquintLeft eyeSquintRight eyeWideLeft eyeWideRight
+    jawForward jawLeft jawOpen jawRight mouthClose mouthDimpleLeft mouthDimpleRight mouthFrownLeft mouthFrownRight
+    mouthFunnel mouthLeft mouthLowerDownLeft mouthLowerDownRight mouthPressLeft mouthPressRight mouthPucker mouthRight
+    mouthRollLower mouthRollUpper mouthShrugLower mouthShrugUpper mouthSmileLeft mouthSmileRight mouthStretchLeft
+    mouthStretchRight mouthUpperUpLeft mouthUpperUpRight noseSneerLeft noseSneerRight
+""".split()
+
+
+def group_shape(annot_type):
+    """(landmarks, channels) of one annotation group, blendshapes are stored as 52 single-channel landmarks"""
+    if annot_type == 'face_blendshapes':
+        return len(BLENDSHAPE_NAMES), 1
+    return LANDMARK_COUNTS[annot_type], len(LANDMARK_CHANNELS)
+
+
+def group_columns(annot_type, channels=LANDMARK_CHANNELS):
+    """Flat column names of an annotation group, in the dotted layout pd.json_normalize produces"""
+    if annot_type == 'face_blendshapes':
+        return [f'{annot_type}.{name}' for name in BLENDSHAPE_NAMES]
+    return [f'{annot_type}.{i}.{c}' for i in range(LANDMARK_COUNTS[annot_type]) for c in channels]
+
+
+def selected_groups():
+    return [annot_type for annot_type, save in CONFIG.SELECTED_POSE_ANNOTATIONS.items() if save]
@@ -1,40 +1,92 @@
 import json
 import pickle
 from io import StringIO
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from util.path_resolver import PATH_RESOLVER as REPATH
 from util.global_logger import GLOBAL_LOGGER as LOG
 from config.config import CONFIG
+from pose_estimation.pose_binary import write_pose_binary, load_pose_binary
+from pose_estimation.pose_quantization import quantize, dequantize
 
 from pathlib import Path
 
 
+_PARQUET_QUANTIZATION_KEY = b'pose_quantization'
+# readable file types, fastest to load first
+_READ_SPEED_ORDER = ('.parquet', '.pose.bin', '.csv.pkl', '.json.pkl', '.csv', '.json')
+
+
+def _in_groups(column, groups):
+    return groups is None or column.split('.', 1)[0] in groups
+
+
 class PoseScribe:
+    @staticmethod
+    def _tabular(data):
+        if isinstance(data, list):
+            try:
+                return pd.json_normalize(data) if data and isinstance(data[0], dict) else pd.DataFrame(data)
+            except ValueError as e:
+                LOG.error(e)
+                return None
+        return data
+
+    @staticmethod
+    def _project_records(records, groups):
+        if records is None or groups is None:
+            return records
+        return [{key: value for key, value in record.items() if key in groups} for record in records]
+
+    @staticmethod
+    def _nested_records(data):
+        # unflatten dotted columns of a frame back into nested per-frame dicts, {annot_type: {index: {x, y, ...}}}
+        if not isinstance(data, pd.DataFrame):
+            return data
+
+        keys = [[int(part) if part.isdigit() else part for part in col.split('.')] for col in data.columns]
+        records = []
+        for row in data.itertuples(index=False, name=None):
+            record = {}
+            for key, value in zip(keys, row):
+                if pd.isna(value):
+                    continue
+                node = record
+                for part in key[:-1]:
+                    node = node.setdefault(part, {})
+                node[key[-1]] = float(value)
+            records.append(record)
+        return records
+
     @staticmethod
     def _json_writer(data, path):
+        data = PoseScribe._nested_records(data)
         with open(path, 'w') as f:
             json.dump(data, f, indent='\t')
 
     @staticmethod
-    def _json_reader(path):
+    def _json_reader(path, groups=None):
         try:
             with open(path, 'r') as f:
-                return json.load(f)
+                return PoseScribe._project_records(json.load(f), groups)
         except FileNotFoundError as e:
             LOG.error(e)
             return None
 
     @staticmethod
     def _json_pickle_writer(data, path):
+        data = PoseScribe._nested_records(data)
         with open(path, 'wb') as f:
             pickle.dump(data, f)
 
     @staticmethod
-    def _json_pickle_reader(path):
+    def _json_pickle_reader(path, groups=None):
         try:
             with open(path, 'rb') as f:
-                return pickle.load(f)
+                return PoseScribe._project_records(pickle.load(f), groups)
         except FileNotFoundError as e:
             LOG.error(e)
             return None
@@ -56,9 +108,9 @@ class PoseScribe:
         data.to_csv(path, index=False)
 
     @staticmethod
-    def _csv_reader(path):
+    def _csv_reader(path, groups=None):
         try:
-            return pd.read_csv(path)
+            return pd.read_csv(path, usecols=lambda column: _in_groups(column, groups))
         except ValueError as e:
             LOG.error(e)
             return None
@@ -82,21 +134,84 @@ class PoseScribe:
             pickle.dump(csv_buffer, f)
 
     @staticmethod
-    def _csv_pickle_reader(path):
+    def _csv_pickle_reader(path, groups=None):
         try:
             with open(path, 'rb') as f:
                 csv_buffer = pickle.load(f)
             csv_buffer.seek(0)
-            return pd.read_csv(csv_buffer)
+            return pd.read_csv(csv_buffer, usecols=lambda column: _in_groups(column, groups))
+        except ValueError as e:
+            LOG.error(e)
+            return None
+
+    @staticmethod
+    def _pose_binary_writer(data, path):
+        data = PoseScribe._tabular(data)
+        if data is None:
+            return None
+
+        columns = [str(column) for column in data.columns]
+        array, quantization = quantize(data.to_numpy(dtype=np.float32), columns, CONFIG.POSE_STORAGE_PRECISION)
+        write_pose_binary(path, array, columns, quantization=quantization)
+
+    @staticmethod
+    def _pose_binary_reader(path, groups=None):
+        try:
+            array, header = load_pose_binary(path, mmap_mode='r')
+            columns = header['columns']
+            if groups is not None:
+                # rows are stored contiguously, so a projection gathers the selected columns out of the memmap
+                selected = [i for i, column in enumerate(columns) if _in_groups(column, groups)]
+                array, columns = array[:, selected], [columns[i] for i in selected]
+            # float32 files stay memory-mapped, reduced precision files are expanded to float32
+            array = dequantize(array, columns, header.get('quantization'))
+            return pd.DataFrame(array, columns=columns, copy=False)
         except ValueError as e:
             LOG.error(e)
             return None
 
+    @staticmethod
+    def _parquet_writer(data, path):
+        data = PoseScribe._tabular(data)
+        if data is None:
+            return None
+
+        columns = [str(column) for column in data.columns]
+        array, quantization = quantize(data.to_numpy(dtype=np.float32), columns, CONFIG.POSE_STORAGE_PRECISION)
+        table = pa.Table.from_arrays([pa.array(array[:, i]) for i in range(len(columns))], names=columns)
+        if quantization is not None:
+            table = table.replace_schema_metadata({_PARQUET_QUANTIZATION_KEY: json.dumps(quantization)})
+        pq.write_table(table, path, compression='zstd')
+
+    @staticmethod
+    def _parquet_reader(path, groups=None):
+        try:
+            columns = None
+            if groups is not None:
+                # the footer schema is enough to resolve the projection, unselected column chunks are never read
+                columns = [column for column in pq.read_schema(path).names if _in_groups(column, groups)]
+            table = pq.read_table(path, columns=columns)
+            metadata = table.schema.metadata or {}
+            quantization = metadata.get(_PARQUET_QUANTIZATION_KEY)
+            if quantization is not None:
+                quantization = json.loads(quantization)
+
+            columns = table.column_names
+            if not columns:
+                return pd.DataFrame(index=range(table.num_rows))
+            array = np.column_stack([table.column(i).to_numpy() for i in range(len(columns))])
+            return pd.DataFrame(dequantize(array, columns, quantization), columns=columns, copy=False)
+        except (ValueError, OSError) as e:
+            LOG.error(e)
+            return None
+
     writers = {
         '.json': _json_writer,
         '.json.pkl': _json_pickle_writer,
         '.csv': _csv_writer,
-        '.csv.pkl': _csv_pickle_writer
+        '.csv.pkl': _csv_pickle_writer,
+        '.pose.bin': _pose_binary_writer,
+        '.parquet': _parquet_writer,
     }
 
     readers = {
@@ -104,20 +219,33 @@ class PoseScribe:
         '.json.pkl': _json_pickle_reader,
         '.csv': _csv_reader,
         '.csv.pkl': _csv_pickle_reader,
+        '.pose.bin': _pose_binary_reader,
+        '.parquet': _parquet_reader,
     }
 
-    def write(self, data, path: Path):
+    def write(self, data, path: Path, force=None):
+        if force is None:
+            force = CONFIG.FORCE_POSE_ANNOTATION
+
         for file_type, perform_write in CONFIG.POSE_ANNOTATION_FILE_TYPES.items():
             if not perform_write:
                 continue
 
             typed_path = path.parent / (path.name + file_type)
-            if REPATH.exists(typed_path) and not CONFIG.FORCE_POSE_ANNOTATION:
+            if REPATH.exists(typed_path) and not force:
                 LOG.info(f"Pose annotation already exists: {typed_path}")
                 continue
             self.writers[file_type](data, typed_path)
 
-    def read(self, path):
+    def read(self, path, groups=None):
+        """
+        Read a pose annotation, all selected file types if the path has no suffix.
+        groups limits the result to the given annotation groups, e.g. ['right_hand_world_landmarks'];
+        columnar files then skip the other groups entirely.
+        """
+        if groups is not None:
+            groups = set(groups)
+
         def _typed_read(t_path, f_type=None):
             if not REPATH.exists(t_path):
                 LOG.error(f"Pose annotation does not exists: {t_path}")
@@ -129,7 +257,7 @@ class PoseScribe:
                 LOG.error(f"Pose scribe cannot handle file type {f_type}")
                 return
 
-            return self.readers[f_type](path)
+            return self.readers[f_type](t_path, groups)
 
         path = Path(path)
         if not path.suffixes:
@@ -153,5 +281,14 @@ class PoseScribe:
             type_existence.append(REPATH.exists(typed_path))
         return all(type_existence)
 
+    @staticmethod
+    def read_preference():
+        """
+        File types in the order an annotation is looked up in: those selected in CONFIG.POSE_ANNOTATION_FILE_TYPES,
+        which are the ones kept up to date, then the rest as a fallback for annotations of earlier runs.
+        """
+        selected = [file_type for file_type in _READ_SPEED_ORDER if CONFIG.POSE_ANNOTATION_FILE_TYPES.get(file_type)]
+        return selected + [file_type for file_type in _READ_SPEED_ORDER if file_type not in selected]
+
 
 pose_scribe = PoseScribe()
@@ -0,0 +1,118 @@
+"""
+Sharded pose store for random access by gloss.
+
+Directory layout:
+    shard_<shard>.bin   raw float32 (frames, features) clips, all clips of one gloss stored next to each other
+    index.json          feature columns, shard count and, per kind ('word' or 'dactyl') and gloss,
+                        the (shard, byte offset, frames) of every clip
+
+A gloss goes to the shard picked by a stable hash of its text, so get() opens a single shard and reads only
+the bytes of the requested clips.
+"""
+import os
+import json
+import zlib
+import shutil
+import numpy as np
+from pathlib import Path
+
+from util.path_resolver import PATH_RESOLVER as REPATH
+from util.global_logger import GLOBAL_LOGGER as LOG
+
+
+STORE_DIR = REPATH.POSE_DATA_DIR / 'pose_store'
+KINDS = ('word', 'dactyl')
+_DTYPE = np.dtype('<f4')
+
+
+def shard_of(gloss, shards):
+    return zlib.crc32(gloss.encode('utf-8')) % shards
+
+
+def _shard_path(path, shard):
+    return path / f'shard_{shard:03d}.bin'
+
+
+def write_pose_store(entries, columns, path=STORE_DIR, shards=16):
+    """
+    :param entries: (kind, gloss, pose) tuples, pose is a (frames, features) array, clips keep their order per gloss
+    :param columns: feature column names.
+    :param path:    store directory, replaced as a whole once the new store is complete.
+    :param shards:  number of shard files.
+    """
+    path = Path(path)
+    features = len(columns)
+    by_shard = [{} for _ in range(shards)]
+    for kind, gloss, pose in entries:
+        if kind not in KINDS:
+            raise ValueError(f'Unknown gloss kind {kind}, expected one of {KINDS}')
+        by_shard[shard_of(gloss, shards)].setdefault((kind, gloss), []).append(pose)
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    index = {kind: {} for kind in KINDS}
+    clips = 0
+    for shard, glosses in enumerate(by_shard):
+        offset = 0
+        with open(_shard_path(tmp_path, shard), 'wb') as f:
+            for (kind, gloss), poses in glosses.items():
+                locations = index[kind].setdefault(gloss, [])
+                for pose in poses:
+                    pose = np.ascontiguousarray(pose, dtype=_DTYPE).reshape(-1, features)
+                    pose.tofile(f)
+                    locations.append([shard, offset, len(pose)])
+                    offset += pose.nbytes
+                    clips += 1
+
+    with open(tmp_path / 'index.json', 'w', encoding='utf-8') as f:
+        json.dump({'columns': list(columns), 'shards': shards, 'glosses': index}, f, ensure_ascii=False)
+
+    # swap the finished store in, readers never see a half written one
+    old_path = path.with_name(path.name + '.old')
+    if path.exists():
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    if old_path.exists():
+        shutil.rmtree(old_path)
+
+    LOG.info(f'Pose store at {path} holds {clips} clips of {sum(len(glosses) for glosses in index.values())} '
+             f'glosses in {shards} shards')
+
+
+class PoseStore:
+    """Reads the clips of single glosses without loading the rest of the pose data"""
+    def __init__(self, path=STORE_DIR):
+        self.path = Path(path)
+        with open(self.path / 'index.json', 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.columns = index['columns']
+        self.shards = index['shards']
+        self.glosses = index['glosses']
+
+    @staticmethod
+    def exists(path=STORE_DIR):
+        return REPATH.exists(Path(path) / 'index.json')
+
+    def words(self, kind='word'):
+        return list(self.glosses[kind])
+
+    def __contains__(self, gloss):
+        return gloss in self.glosses['word']
+
+    def get(self, gloss, kind='word'):
+        """All clips of a gloss as float32 (frames, features) arrays, an empty list for an unknown gloss"""
+        locations = self.glosses[kind].get(gloss)
+        if not locations:
+            return []
+
+        features = len(self.columns)
+        poses = []
+        with open(_shard_path(self.path, locations[0][0]), 'rb') as f:
+            for _, offset, frames in locations:
+                f.seek(offset)
+                pose = np.fromfile(f, dtype=_DTYPE, count=frames * features)
+                poses.append(pose.reshape(frames, features))
+        return poses
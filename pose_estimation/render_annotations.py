@@ -0,0 +1,198 @@
+import cv2
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from mediapipe.python.solutions.drawing_utils import DrawingSpec, WHITE_COLOR
+
+from config.config import CONFIG
+from util.global_logger import GLOBAL_LOGGER as LOG
+from util.path_resolver import PATH_RESOLVER as REPATH
+from pose_estimation.pose_scribe import pose_scribe
+from pose_estimation.pose_schema import LANDMARK_COUNTS
+from pose_estimation.estimate_poses import reevaluate_poses
+
+_VISIBILITY_THRESHOLD = 0.5
+_PRESENCE_THRESHOLD = 0.5
+
+
+class _GroupStyle:
+    """
+    Drawing batches of one entry of CONFIG.VIDEO_ANNOTATION_STYLES.
+
+    Connections and landmarks sharing a DrawingSpec are gathered into index arrays once, so a frame is drawn with
+    one cv2.polylines call per batch instead of one cv2.line / cv2.circle call per element.
+    """
+    def __init__(self, annot_type, connections, landmark_spec=DrawingSpec(color=(0, 0, 255)),
+                 connection_spec=DrawingSpec()):
+        self.annot_type = annot_type
+        self.landmarks = LANDMARK_COUNTS[annot_type]
+
+        self.connection_batches = []
+        if connections:
+            batches = {}
+            for connection in connections:
+                spec = connection_spec[connection] if isinstance(connection_spec, Mapping) else connection_spec
+                batches.setdefault((spec.color, spec.thickness), []).append(connection)
+            self.connection_batches = [(np.array(pairs), color, thickness)
+                                       for (color, thickness), pairs in batches.items()]
+
+        self.landmark_batches = []
+        if landmark_spec:
+            batches = {}
+            for idx in range(self.landmarks):
+                spec = landmark_spec.get(idx) if isinstance(landmark_spec, Mapping) else landmark_spec
+                if spec is not None:
+                    batches.setdefault((spec.color, spec.thickness, spec.circle_radius), []).append(idx)
+            self.landmark_batches = [(np.array(idx), color, thickness, radius)
+                                     for (color, thickness, radius), idx in batches.items()]
+
+    @staticmethod
+    def _draw_circles(image, centers, radius, color, thickness):
+        if thickness < 0:
+            # a zero-length thick line is rasterized as a filled disc, 2r-1 matches cv2.circle(radius=r)
+            segments = np.repeat(centers[:, None, :], 2, axis=1)
+            cv2.polylines(image, segments, False, color, max(2 * radius - 1, 1))
+        else:
+            outline = cv2.ellipse2Poly((0, 0), (radius, radius), 0, 0, 360, 10)
+            cv2.polylines(image, centers[:, None, :] + outline[None], True, color, thickness)
+
+    def draw(self, image, points, visible):
+        for pairs, color, thickness in self.connection_batches:
+            pairs = pairs[visible[pairs].all(axis=1)]
+            if len(pairs):
+                cv2.polylines(image, points[pairs], False, color, thickness)
+
+        for idx, color, thickness, radius in self.landmark_batches:
+            idx = idx[visible[idx]]
+            if not len(idx):
+                continue
+            border_radius = max(radius + 1, int(radius * 1.2))
+            self._draw_circles(image, points[idx], border_radius, WHITE_COLOR, thickness)
+            self._draw_circles(image, points[idx], radius, color, thickness)
+
+
+def _group_styles():
+    return [_GroupStyle(annot_type, *style) for annot_type, *style in CONFIG.VIDEO_ANNOTATION_STYLES]
+
+
+def _group_landmarks(df, annot_type, landmarks):
+    """(frames, landmarks, 2) normalized xy and a (frames, landmarks) visibility mask from stored columns"""
+    def channel(c):
+        columns = [f'{annot_type}.{i}.{c}' for i in range(landmarks)]
+        return df.reindex(columns=columns).to_numpy(dtype=np.float32)
+
+    xy = np.stack([channel('x'), channel('y')], axis=-1)
+    visible = ~np.isnan(xy).any(axis=-1) & (xy >= 0).all(axis=-1) & (xy <= 1).all(axis=-1)
+    with np.errstate(invalid='ignore'):
+        visible &= ~(channel('v') < _VISIBILITY_THRESHOLD)
+        visible &= ~(channel('p') < _PRESENCE_THRESHOLD)
+    return xy, visible
+
+
+def _read_annotation(annotation_path):
+    for file_type in pose_scribe.read_preference():
+        typed_path = annotation_path.parent / (annotation_path.name + file_type)
+        if not REPATH.exists(typed_path):
+            continue
+        data = pose_scribe.read(typed_path, groups=[style.annot_type for style in _group_styles()])
+        if isinstance(data, list):
+            data = pd.json_normalize(data)
+        return data
+    return None
+
+
+def render_video(in_path, annotation_path, out_path):
+    df = _read_annotation(annotation_path)
+    if df is None or df.empty:
+        LOG.error(f'No pose annotation found for {in_path.name}')
+        return False
+
+    styles = [style for style in _group_styles() if f'{style.annot_type}.0.x' in df.columns]
+    if not styles:
+        LOG.warning(f'{annotation_path.name} has no normalized landmark groups to draw, '
+                    f'enable them in CONFIG.SELECTED_POSE_ANNOTATIONS')
+        return False
+    groups = [_group_landmarks(df, style.annot_type, style.landmarks) for style in styles]
+
+    in_vid = cv2.VideoCapture(str(in_path))
+    if not in_vid.isOpened():
+        LOG.error(f"Error opening video file {in_path}")
+        return False
+
+    width = int(in_vid.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(in_vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_rate = int(in_vid.get(cv2.CAP_PROP_FPS))
+    out_vid = cv2.VideoWriter(str(out_path), cv2.VideoWriter.fourcc(*'mp4v'), frame_rate, (width, height))
+    scale = np.array([width, height], dtype=np.float32)
+    limit = np.array([width - 1, height - 1])
+
+    frame = 0
+    while True:
+        # frames are drawn in the BGR space they were decoded in, no color round trip is needed
+        success, image = in_vid.read()
+        if not success:
+            break
+
+        if frame < len(df):
+            for style, (xy, visible) in zip(styles, groups):
+                if not visible[frame].any():
+                    continue
+                points = np.minimum(np.floor(np.nan_to_num(xy[frame]) * scale).astype(np.int32), limit)
+                style.draw(image, points, visible[frame])
+
+        out_vid.write(image)
+        frame += 1
+
+    in_vid.release()
+    out_vid.release()
+    if frame != len(df):
+        LOG.warning(f'{in_path.name} has {frame} frames, but its annotation has {len(df)}')
+    return True
+
+
+def _render_jobs():
+    sources = []
+    if CONFIG.POSE_ESTIMATION_SOURCE['dactyl']:
+        sources.append(('dactyl.csv', REPATH.DACTYL_POSE_DIR))
+    if CONFIG.POSE_ESTIMATION_SOURCE['words']:
+        sources.append(('words_clean.csv', REPATH.WORD_POSE_DIR))
+
+    jobs = []
+    for annotation_file, save_path in sources:
+        df = pd.read_csv(REPATH.ANNOTATION_DIR / annotation_file, delimiter=';')
+        if annotation_file == 'words_clean.csv':
+            # only the words estimate_poses estimated have annotations to render
+            df = reevaluate_poses(df)
+        for path in df['local_path']:
+            in_path = REPATH.PROJECT_ROOT / path
+            out_path = save_path / in_path.name
+            if REPATH.exists(out_path) and not CONFIG.FORCE_VIDEO_ANNOTATION:
+                LOG.info(f"Video already exists: {out_path}")
+                continue
+            jobs.append((in_path, save_path / in_path.stem, out_path))
+    return jobs
+
+
+def render_annotated_videos():
+    jobs = _render_jobs()
+    LOG.info(f'Rendering {len(jobs)} annotated videos with {CONFIG.VIDEO_RENDERING_WORKERS} workers')
+
+    done = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=CONFIG.VIDEO_RENDERING_WORKERS) as executor:
+        futures = {executor.submit(render_video, *job): job[0] for job in jobs}
+        for future in as_completed(futures):
+            done += 1
+            try:
+                if not future.result():
+                    failed += 1
+            except Exception as e:
+                LOG.exception(f'Rendering failed for {futures[future]}: {e}')
+                failed += 1
+            LOG.info(f'Rendering progress: {done}/{len(jobs)} videos, {failed} failed')
+
+
+if __name__ == '__main__':
+    render_annotated_videos()
@@ -0,0 +1,76 @@
+import json
+import pandas as pd
+from time import perf_counter, strftime
+from contextlib import contextmanager
+from collections import defaultdict
+
+from util.global_logger import GLOBAL_LOGGER as LOG
+from util.path_resolver import PATH_RESOLVER as REPATH
+
+
+class StageTimer:
+    """
+    Wall time per pipeline stage of one video.
+
+    Stages that run on the frame prefetch thread (decode, convert) overlap the others, so the stage times
+    may add up to more than the total wall time.
+    """
+    def __init__(self, video):
+        self.video = str(video)
+        self.stages = defaultdict(float)
+        self.frames = 0
+        self._start = perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += perf_counter() - start
+
+    def add(self, name, seconds):
+        self.stages[name] += seconds
+
+    def report(self):
+        total = perf_counter() - self._start
+        return {
+            'video': self.video,
+            'frames': self.frames,
+            'total_seconds': total,
+            'fps': self.frames / total if total > 0 else 0.0,
+            **{f'{name}_seconds': seconds for name, seconds in self.stages.items()}
+        }
+
+
+class TimingReport:
+    """Collects StageTimer reports of a run and saves them to logs/ as CSV and JSON"""
+    def __init__(self, name):
+        self.name = name
+        self.rows = []
+
+    def add(self, row):
+        if row:
+            self.rows.append(row)
+
+    def save(self, slowest=10):
+        if not self.rows:
+            return None
+
+        df = pd.DataFrame(self.rows).fillna(0.0)
+        stem = REPATH.LOG_DIR / f'{self.name}_{strftime("%Y%m%d-%H%M%S")}'
+        df.to_csv(stem.with_suffix('.csv'), index=False)
+        with open(stem.with_suffix('.json'), 'w', encoding='utf-8') as f:
+            json.dump(df.to_dict(orient='records'), f, indent='\t')
+        LOG.info(f'Saved timing report to {stem}.csv')
+
+        stage_columns = [col for col in df.columns if col.endswith('_seconds') and col != 'total_seconds']
+        totals = df[stage_columns].sum().sort_values(ascending=False)
+        LOG.info(f'{len(df)} videos, {int(df["frames"].sum())} frames in {df["total_seconds"].sum():.1f}s, '
+                 f'mean {df["fps"].mean():.1f} fps')
+        LOG.info('Time per stage: ' + ', '.join(f'{col[:-len("_seconds")]} {sec:.2f}s' for col, sec in totals.items()))
+
+        LOG.info(f'{min(slowest, len(df))} slowest videos:')
+        for row in df.nlargest(slowest, 'total_seconds').itertuples():
+            LOG.info(f'{row.total_seconds:8.2f}s {row.frames:6d} frames {row.fps:7.1f} fps  {row.video}')
+        return df
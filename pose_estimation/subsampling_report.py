@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+from time import perf_counter
+
+from config.config import CONFIG
+from util.global_logger import GLOBAL_LOGGER as LOG
+from util.path_resolver import PATH_RESOLVER as REPATH
+from pose_estimation.estimate_poses import holistic_process, reevaluate_poses, _HOLISTIC_OPTIONS
+from pose_estimation.landmarker import ReusableLandmarker
+
+
+def compare_buffers(reference, candidate):
+    """
+    Per-group error of a subsampled estimation against a full-rate one.
+
+    Errors are taken over the coordinates detected in both, detection agreement is the share of frames where
+    both runs agree on whether the group was found at all.
+    """
+    frames = min(len(reference), len(candidate))
+    report = {}
+    for annot_type in reference.groups:
+        ref = reference.group_array(annot_type)[:frames, :, :3]
+        cand = candidate.group_array(annot_type)[:frames, :, :3]
+
+        both = ~np.isnan(ref) & ~np.isnan(cand)
+        error = np.abs(ref - cand)[both]
+        ref_detected = ~np.isnan(ref[:, 0, 0])
+        cand_detected = ~np.isnan(cand[:, 0, 0])
+
+        report[annot_type] = {
+            'mean_abs_error': float(error.mean()) if error.size else np.nan,
+            'p95_abs_error': float(np.percentile(error, 95)) if error.size else np.nan,
+            'detection_agreement': float((ref_detected == cand_detected).mean()) if frames else np.nan,
+        }
+    return report
+
+
+def _sample_videos(sample_size, seed):
+    paths = []
+    if CONFIG.POSE_ESTIMATION_SOURCE['dactyl']:
+        paths.extend(pd.read_csv(REPATH.ANNOTATION_DIR / 'dactyl.csv', delimiter=';')['local_path'])
+    if CONFIG.POSE_ESTIMATION_SOURCE['words']:
+        words = reevaluate_poses(pd.read_csv(REPATH.ANNOTATION_DIR / 'words_clean.csv', delimiter=';'))
+        paths.extend(words['local_path'])
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(paths), size=min(sample_size, len(paths)), replace=False)
+    return [REPATH.PROJECT_ROOT / paths[i] for i in sorted(sample)]
+
+
+def subsampling_report(sample_size=20, stride=None, max_side=None, seed=0):
+    """
+    Estimates a random sample of videos at full rate and with frame stride / input downscaling,
+    then writes the per-video, per-group accuracy and timing comparison to logs/subsampling_report.csv.
+    """
+    stride = CONFIG.POSE_FRAME_STRIDE if stride is None else stride
+    max_side = CONFIG.POSE_MAX_INPUT_SIDE if max_side is None else max_side
+    LOG.info(f'Comparing stride {stride}, max side {max_side} against full-rate estimation '
+             f'on {sample_size} videos')
+
+    rows = []
+    with ReusableLandmarker(_HOLISTIC_OPTIONS) as landmarker:
+        for in_path in _sample_videos(sample_size, seed):
+            start = perf_counter()
+            reference = holistic_process(in_path, None, landmarker, stride=1, max_side=0)
+            full_time = perf_counter() - start
+
+            start = perf_counter()
+            candidate = holistic_process(in_path, None, landmarker, stride=stride, max_side=max_side)
+            sub_time = perf_counter() - start
+
+            if reference is None or candidate is None:
+                LOG.error(f'Skipping {in_path.name} in subsampling report')
+                continue
+
+            for annot_type, metrics in compare_buffers(reference, candidate).items():
+                rows.append({
+                    'video': in_path.name,
+                    'frames': len(reference),
+                    'group': annot_type,
+                    'full_rate_seconds': full_time,
+                    'subsampled_seconds': sub_time,
+                    **metrics
+                })
+
+    report = pd.DataFrame(rows)
+    report_path = REPATH.LOG_DIR / 'subsampling_report.csv'
+    report.to_csv(report_path, index=False)
+    if report.empty:
+        LOG.warning('Subsampling report is empty')
+        return report
+
+    timing = report.drop_duplicates('video')
+    speedup = timing['full_rate_seconds'].sum() / max(timing['subsampled_seconds'].sum(), 1e-9)
+    LOG.info(f'Subsampling speedup over {len(timing)} videos: {speedup:.2f}x')
+    for annot_type, group in report.groupby('group'):
+        LOG.info(f'{annot_type:30}: mean abs error {group["mean_abs_error"].mean():.5f}, '
+                 f'p95 abs error {group["p95_abs_error"].mean():.5f}, '
+                 f'detection agreement {group["detection_agreement"].mean():.3f}')
+    LOG.info(f'Saved subsampling report to {report_path}')
+    return report
+
+
+if __name__ == '__main__':
+    subsampling_report()
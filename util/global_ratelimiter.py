@@ -1,4 +1,97 @@
-from requests_ratelimiter import LimiterSession
+import time
+import sqlite3
+import asyncio
+import threading
+from requests import Session
 from config.config import CONFIG
+from util.path_resolver import PATH_RESOLVER as REPATH
 
-GLOBAL_SESSION = LimiterSession(per_second=CONFIG.REQUESTS_PER_SECOND)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, shared by blocking requests and the asyncio scraper.
+
+    Every acquisition reserves a token right away, possibly driving the balance negative, and then waits for
+    the deficit to refill. Callers are served in the order they arrive and the overall rate never exceeds
+    rate per second, however the callers are split between threads and event loops.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes a token and returns how many seconds the caller has to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose balance is a row in an SQLite database, so every process scraping the same data directory
+    draws from one budget of rate requests per second. Wall-clock time is used, monotonic clocks differ per process.
+    """
+    def __init__(self, path, rate, capacity=None, name='site'):
+        super().__init__(rate, capacity)
+        self.path = path
+        self.name = name
+        self.local = threading.local()
+
+    def _connection(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS rate_limit (name TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+            self.local.db = db
+        return db
+
+    def _reserve(self):
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = db.execute('SELECT tokens, updated FROM rate_limit WHERE name = ?', (self.name,)).fetchone()
+            tokens, updated = row if row is not None else (self.capacity, now)
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate) - 1
+            db.execute('INSERT OR REPLACE INTO rate_limit (name, tokens, updated) VALUES (?, ?, ?)',
+                       (self.name, tokens, now))
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return max(0.0, -tokens / self.rate)
+
+
+class RateLimitedSession(Session):
+    """requests session that takes a token from the bucket before every request"""
+    def __init__(self, bucket):
+        super().__init__()
+        self.bucket = bucket
+
+    def request(self, *args, **kwargs):
+        self.bucket.acquire()
+        return super().request(*args, **kwargs)
+
+
+if CONFIG.REQUESTS_SHARED_BY_PROCESSES:
+    GLOBAL_BUCKET = SharedTokenBucket(REPATH.CRAWL_FRONTIER_DB, CONFIG.REQUESTS_PER_SECOND)
+else:
+    GLOBAL_BUCKET = TokenBucket(CONFIG.REQUESTS_PER_SECOND)
+GLOBAL_SESSION = RateLimitedSession(GLOBAL_BUCKET)
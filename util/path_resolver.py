@@ -21,6 +21,9 @@ class PathResolver:
     WORD_RAW_DIR = RAW_DATA_DIR / 'words'
     WORD_POSE_DIR = POSE_DATA_DIR / 'words'
 
+    PAGE_CACHE_DIR = DATA_DIR / 'page_cache'
+    CRAWL_FRONTIER_DB = DATA_DIR / 'crawl_frontier.sqlite'
+
     LANG_DATASET_DIR = DATA_DIR / CONFIG.LANG_DATASET_DIR_NAME
 
     MODEL_DIR = PROJECT_ROOT / 'models' / CONFIG.LANG_ALIAS